@@ -0,0 +1,82 @@
+"""Concurrent load test for the subscription API.
+
+Registers a throwaway user, then fires listing and creation requests at a
+running server from a thread pool and reports throughput and latency
+percentiles. Run it once against the WSGI server and once against the ASGI
+server to compare how they handle concurrent requests:
+
+    gunicorn project.wsgi -w 2 -b 127.0.0.1:8000
+    gunicorn project.asgi:application -w 2 -k uvicorn_worker.UvicornWorker -b 127.0.0.1:8000
+
+    python benchmarks/api_load.py --base-url http://127.0.0.1:8000 --concurrency 50 --requests 500
+
+Recorded results, with the setup they were taken on, are in api_load_report.txt.
+"""
+import argparse
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+def authenticate(base_url):
+    email = f'load-{uuid.uuid4().hex[:12]}@example.com'
+    password = uuid.uuid4().hex
+    requests.post(f'{base_url}/api/users/register/', json={'email': email, 'password': password}).raise_for_status()
+    response = requests.post(f'{base_url}/api/users/token/', json={'email': email, 'password': password})
+    response.raise_for_status()
+    return response.json()['access']
+
+def run(name, total, concurrency, send):
+    latencies, errors = [], 0
+
+    def timed(index):
+        started = time.perf_counter()
+        response = send(index)
+        return time.perf_counter() - started, response.ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, ok in pool.map(timed, range(total)):
+            latencies.append(latency)
+            errors += not ok
+    elapsed = time.perf_counter() - started
+
+    print(
+        f'{name:<8} {total / elapsed:8.1f} req/s  '
+        f'p50 {statistics.median(latencies) * 1000:7.1f} ms  '
+        f'p95 {percentile(latencies, 95) * 1000:7.1f} ms  '
+        f'p99 {percentile(latencies, 99) * 1000:7.1f} ms  '
+        f'errors {errors}'
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {authenticate(base_url)}'
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    run_id = uuid.uuid4().hex[:6]
+
+    run('create', args.requests, args.concurrency, lambda i: session.post(
+        f'{base_url}/api/subscriptions/',
+        json={'city': f'Load {run_id} {i}', 'notification_period': 1, 'notification_method': 'email'},
+    ))
+    run('list', args.requests, args.concurrency, lambda i: session.get(f'{base_url}/api/subscriptions/'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Webhook delivery throughput on a prefork pool versus a gevent pool.
+
+Starts a local endpoint that answers every webhook after a fixed delay,
+standing in for a slow customer server, then pushes the same number of
+deliveries through `send_weather_webhook` using either a pool of processes
+(what `celery worker -P prefork` does) or a pool of greenlets (`-P gevent`):
+
+    python benchmarks/delivery_pools.py --pool prefork --concurrency 4 --deliveries 200
+    python benchmarks/delivery_pools.py --pool gevent --concurrency 200 --deliveries 2000
+
+Deliveries are I/O bound, so throughput on prefork is capped at roughly
+concurrency / delay while the gevent pool scales with the number of greenlets.
+Recorded results are in delivery_pools_report.txt.
+"""
+import sys
+
+if '--pool' in sys.argv and sys.argv[sys.argv.index('--pool') + 1] == 'gevent':
+    # Must happen before anything imports socket, ssl or requests.
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import socket  # noqa: E402
+import subprocess  # noqa: E402
+import time  # noqa: E402
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # noqa: E402
+from multiprocessing import Pool  # noqa: E402
+from pathlib import Path  # noqa: E402
+from types import SimpleNamespace  # noqa: E402
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from notifications.services.webhook_sender import send_weather_webhook  # noqa: E402
+
+WEATHER = {'main': {'temp': 12.3}, 'weather': [{'description': 'light rain'}], 'wind': {'speed': 4.2}}
+
+
+def serve(port, delay):
+    class SlowHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(delay)
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # Read by listen() in the constructor, so it must be set on the class.
+        request_queue_size = 1024
+        daemon_threads = True
+
+    Server(('127.0.0.1', port), SlowHandler).serve_forever()
+
+def wait_for_port(port, timeout=30):
+    """Blocks until the endpoint accepts connections; it loads Django first"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def deliver(args):
+    index, url = args
+    subscription = SimpleNamespace(
+        id=index, webhook_url=url, city='Oslo', user=SimpleNamespace(email=f'bench{index}@example.com')
+    )
+    send_weather_webhook(subscription, WEATHER)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pool', choices=['prefork', 'gevent'], default='prefork')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--deliveries', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds the endpoint takes to answer')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.delay)
+        return
+
+    # The endpoint runs in its own unpatched interpreter so it never competes
+    # with the pool under test for the event loop or the GIL.
+    server = subprocess.Popen([
+        sys.executable, __file__, '--serve', '--port', str(args.port), '--delay', str(args.delay),
+    ])
+    wait_for_port(args.port)
+    jobs = [(index, f'http://127.0.0.1:{args.port}/hook') for index in range(args.deliveries)]
+
+    try:
+        started = time.perf_counter()
+        if args.pool == 'gevent':
+            from gevent.pool import Pool as GreenPool
+            GreenPool(args.concurrency).map(deliver, jobs)
+        else:
+            with Pool(args.concurrency) as pool:
+                pool.map(deliver, jobs, chunksize=1)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+
+    print(f'{args.pool:<8} concurrency={args.concurrency:<4} deliveries={args.deliveries:<6} '
+          f'elapsed={elapsed:.2f}s  throughput={args.deliveries / elapsed:.1f}/s')
+
+
+if __name__ == '__main__':
+    main()
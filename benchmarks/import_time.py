@@ -0,0 +1,79 @@
+"""Cold-start import profile for the web and worker processes.
+
+Runs a fresh interpreter with ``-X importtime`` for each entry point and
+summarises where the start-up time goes, so regressions from new eager
+imports show up in review. Compare against the checked-in report:
+
+    python benchmarks/import_time.py --top 15 > benchmarks/import_time_report.txt
+
+`web` boots the ASGI application the way a gunicorn worker does; `worker`
+loads the Celery app and the notification tasks the way a worker does
+before forking its pool. DEBUG defaults to true so no mail credentials are
+needed. Numbers vary by machine, so compare runs made on the same host.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENTRY_POINTS = {
+    'web': 'import project.asgi',
+    'worker': 'from project.celery import app; app.loader.import_default_modules()',
+}
+# Modules kept off the start-up path; they load on first use (or in the worker warm-up).
+LAZY_MODULES = (
+    'dj_database_url',
+    'dotenv',
+    'notifications.services.weather_client',
+    'notifications.services.email_sender',
+    'notifications.services.webhook_sender',
+)
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def profile(code, runs):
+    """Returns {module: (self_us, cumulative_us, depth)} from the fastest of `runs` runs"""
+    best = None
+    env = {
+        'DJANGO_SETTINGS_MODULE': 'project.settings', 'SECRET_KEY': 'benchmark', 'DEBUG': 'true',
+        **os.environ,
+    }
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            sys.exit(result.stderr.splitlines()[-1])
+        modules = {}
+        for match in LINE.finditer(result.stderr):
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+        total = sum(cumulative for _, cumulative, depth in modules.values() if depth == 0)
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='report the fastest of this many cold starts')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for name, code in ENTRY_POINTS.items():
+        total, modules = profile(code, args.runs)
+        print(f'== {name}: {total / 1000:.1f} ms total imports ({len(modules)} modules)')
+        heaviest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+        for module, (_, cumulative, _) in [item for item in heaviest if '.' not in item[0]][:args.top]:
+            print(f'  {cumulative / 1000:8.1f} ms  {module}')
+        for module in LAZY_MODULES:
+            print(f'  {"loaded" if module in modules else "not loaded":>11}  {module}')
+        print()
+
+
+if __name__ == '__main__':
+    main()
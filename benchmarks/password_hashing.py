@@ -0,0 +1,46 @@
+"""Registrations per second per worker for each configured password hasher.
+
+Hashing dominates the cost of a signup request, so the rate at which one
+process can hash passwords is the ceiling on registrations per web worker.
+Cost parameters come from the PASSWORD_* settings, so export the same
+environment as production before running:
+
+    PASSWORD_SCRYPT_WORK_FACTOR=16384 python benchmarks/password_hashing.py --rounds 20
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.hashers import get_hashers, make_password  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    for hasher in get_hashers():
+        try:
+            make_password('warm-up', hasher=hasher.algorithm)
+        except ValueError as exc:  # e.g. argon2-cffi not installed
+            print(f'{hasher.algorithm:<36} skipped: {exc}')
+            continue
+
+        started = time.perf_counter()
+        for index in range(args.rounds):
+            make_password(f'benchmark-password-{index}', hasher=hasher.algorithm)
+        per_hash = (time.perf_counter() - started) / args.rounds
+        print(f'{hasher.algorithm:<36} {per_hash * 1000:8.1f} ms/hash  {1 / per_hash:8.1f} registrations/s per worker')
+
+
+if __name__ == '__main__':
+    main()
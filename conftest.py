@@ -0,0 +1,26 @@
+import fakeredis
+import pytest
+from project.celery import app as celery_app
+from subscriptions.cities import city_index
+
+
+@pytest.fixture(autouse=True)
+def reset_city_index():
+    """The city alias index is process-wide, so drop it between tests
+    to avoid pointing at rows rolled back by a previous test
+    """
+    city_index.invalidate()
+    yield
+    city_index.invalidate()
+
+@pytest.fixture(autouse=True, scope='session')
+def eager_celery():
+    """Runs chained tasks inline so a whole notification run completes in-process"""
+    celery_app.conf.update(task_always_eager=True, task_eager_propagates=True)
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """Points the shared Redis client at a fresh in-memory server for each test"""
+    connection = fakeredis.FakeRedis()
+    monkeypatch.setattr('project.redis_client._connection', connection)
+    return connection
@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import FailedDelivery
+
+
+@admin.register(FailedDelivery)
+class FailedDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('task_name', 'attempts', 'failed_at', 'replayed_at')
+    list_filter = ('task_name',)
+    readonly_fields = ('task_name', 'args', 'attempts', 'error', 'failed_at', 'replayed_at')
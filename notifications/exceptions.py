@@ -0,0 +1,2 @@
+class DeliveryError(Exception):
+    """Raised when an email or webhook could not be delivered"""
@@ -0,0 +1,44 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from notifications.services.email_template import SOURCE_TEMPLATE, build_artifact, compiled_dir, read_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        'Precompiles the notification email template (CSS inlined, whitespace stripped) into '
+        'a content-hashed artifact that workers load instead of the source'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Exit with an error if the compiled artifact is missing or out of date, without writing',
+        )
+
+    def handle(self, *args, **options):
+        artifact = build_artifact(SOURCE_TEMPLATE)
+        directory = compiled_dir()
+        manifest = read_manifest()
+        entry = {'name': artifact['name'], 'source_sha256': artifact['source_sha256']}
+        path = directory / artifact['name'].rsplit('/', 1)[-1]
+
+        if options['check']:
+            if manifest.get(SOURCE_TEMPLATE) != entry or not path.exists():
+                raise CommandError(
+                    f'{SOURCE_TEMPLATE} has changed; run `manage.py compile_email_templates` and commit the result.'
+                )
+            self.stdout.write(f'{artifact["name"]} is up to date.')
+            return
+
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = path.name.split('.', 1)[0]
+        for stale in directory.glob(f'{stem}.*.html'):
+            if stale != path:
+                stale.unlink()
+        path.write_text(artifact['compiled'], encoding='utf-8')
+        manifest[SOURCE_TEMPLATE] = entry
+        (directory / 'manifest.json').write_text(json.dumps(manifest, indent=2) + '\n', encoding='utf-8')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Compiled {SOURCE_TEMPLATE} to {artifact["name"]} ({len(artifact["compiled"].encode())} bytes).'
+        ))
@@ -0,0 +1,38 @@
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from notifications.models import FailedDelivery
+from project.celery import app
+
+
+class Command(BaseCommand):
+    help = 'Re-enqueues dead-lettered email and webhook deliveries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task', help='Only replay this task, e.g. deliver_webhook')
+        parser.add_argument('--limit', type=int, help='Replay at most this many, oldest first')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be replayed')
+
+    def handle(self, *args, **options):
+        pending = FailedDelivery.objects.filter(replayed_at__isnull=True).order_by('failed_at')
+        if options['task']:
+            pending = pending.filter(Q(task_name=options['task']) | Q(task_name__endswith=f".{options['task']}"))
+        if options['limit']:
+            pending = pending[:options['limit']]
+        deliveries = list(pending)
+
+        for task_name, count in sorted(Counter(delivery.task_name for delivery in deliveries).items()):
+            self.stdout.write(f'{task_name}: {count}')
+        if options['dry_run'] or not deliveries:
+            self.stdout.write(f'{len(deliveries)} failed deliveries pending.')
+            return
+
+        # Mark first: a replay that fails again is dead-lettered as a new row.
+        FailedDelivery.objects.filter(id__in=[delivery.id for delivery in deliveries]).update(
+            replayed_at=timezone.now()
+        )
+        for delivery in deliveries:
+            app.tasks[delivery.task_name].delay(*delivery.args)
+
+        self.stdout.write(self.style.SUCCESS(f'Replayed {len(deliveries)} failed deliveries.'))
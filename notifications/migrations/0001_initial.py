@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=200)),
+                ('args', models.JSONField(default=list)),
+                ('attempts', models.PositiveIntegerField()),
+                ('error', models.TextField(blank=True)),
+                ('failed_at', models.DateTimeField(auto_now_add=True)),
+                ('replayed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'failed deliveries',
+                'ordering': ['-failed_at'],
+                'indexes': [models.Index(condition=models.Q(('replayed_at__isnull', True)), fields=['failed_at'], name='failed_delivery_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import models
+
+
+class FailedDelivery(models.Model):
+    """A delivery task that ran out of retries.
+    Keeps the task name and arguments so it can be replayed unchanged with
+    the `replay_failed_deliveries` command once the endpoint is fixed
+    """
+    task_name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    attempts = models.PositiveIntegerField()
+    error = models.TextField(blank=True)
+    failed_at = models.DateTimeField(auto_now_add=True)
+    replayed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.task_name} failed at {self.failed_at:%Y-%m-%d %H:%M}'
+
+    class Meta:
+        verbose_name_plural = 'failed deliveries'
+        ordering = ['-failed_at']
+        indexes = [
+            models.Index(
+                fields=['failed_at'],
+                name='failed_delivery_pending_idx',
+                condition=models.Q(replayed_at__isnull=True),
+            ),
+        ]
@@ -0,0 +1,23 @@
+from django.conf import settings
+
+
+def weather_fingerprint(weather_data: dict) -> dict:
+    """A compact summary of a reading, stored per subscription after each send"""
+    return {
+        'temp': weather_data.get('main', {}).get('temp'),
+        'desc': weather_data.get('weather', [{}])[0].get('description'),
+    }
+
+def has_significant_change(previous: dict, current: dict) -> bool:
+    """Whether a new reading differs enough from the last delivered one to notify.
+    A missing previous fingerprint always counts as a change
+    """
+    if not previous:
+        return True
+    if settings.NOTIFY_ON_CHANGE_DESCRIPTION and previous.get('desc') != current.get('desc'):
+        return True
+
+    previous_temp, current_temp = previous.get('temp'), current.get('temp')
+    if previous_temp is None or current_temp is None:
+        return previous_temp != current_temp
+    return abs(current_temp - previous_temp) >= settings.NOTIFY_ON_CHANGE_TEMP_DELTA
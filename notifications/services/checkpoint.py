@@ -0,0 +1,148 @@
+import json
+import time
+from datetime import datetime
+from django.conf import settings
+from project.redis_client import get_redis_connection
+
+
+class PlannerCheckpoint:
+    """Progress of the planner run in flight, kept in Redis so a continuation or
+    a redelivered task carries on where the last one stopped.
+
+    A run covers one or more windows: the time a beat tick planned for and the
+    highest user id planned for it so far (runs go user by user so a digest is
+    never split). A tick that arrives while a
+    run is still going adds its window to that run instead of starting a second
+    one, so the two never plan the same subscription. Every change happens in a
+    WATCH/MULTI transaction because the running task and beat update it together.
+
+    `updated_at` is the run's heartbeat: only the task working on the run moves
+    it, so a tick can tell a run whose continuation was lost and take it over
+    """
+    KEY = 'planner:checkpoint'
+    # Long enough for a chain of continuations; a run left behind by a lost
+    # message is picked up by the next tick well within it.
+    TTL = 6 * 3600
+
+    def __init__(self, run_id: str, windows: list, planned: int = 0, task_id=None, updated_at=None, connection=None):
+        self.run_id = run_id
+        self.windows = windows
+        self.planned = planned
+        self.task_id = task_id
+        self.updated_at = updated_at or time.time()
+        self.redis = connection or get_redis_connection()
+
+    @property
+    def readings_id(self) -> str:
+        """Run id the weather readings are published under. It changes when a
+        later tick joins so that tick's deliveries get fresh readings
+        """
+        return f'{self.run_id}-{len(self.windows)}'
+
+    def is_stale(self) -> bool:
+        """Whether the run has not advanced for longer than any task of it can take"""
+        return self.updated_at < time.time() - 2 * settings.PLANNER_RUN_BUDGET
+
+    def due_windows(self) -> list:
+        """Returns (now, after_user_id) for every window of the run"""
+        return [(datetime.fromisoformat(now), after_id) for now, after_id in self.windows]
+
+    def as_dict(self) -> dict:
+        return {
+            'run_id': self.run_id,
+            'windows': self.windows,
+            'planned': self.planned,
+            'task_id': self.task_id,
+            'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def _decode(cls, value, connection):
+        return cls(**json.loads(value), connection=connection) if value else None
+
+    @classmethod
+    def load(cls, connection=None):
+        connection = connection or get_redis_connection()
+        return cls._decode(connection.get(cls.KEY), connection)
+
+    def _update(self, change):
+        """Applies `change(current)` to the stored checkpoint atomically. `change`
+        returns the checkpoint to store, or None to delete it; the stored state
+        is copied onto this instance. Returns False if the run is gone
+        """
+        def apply(pipe):
+            current = self._decode(pipe.get(self.KEY), self.redis)
+            if current is None or current.run_id != self.run_id:
+                return False
+            updated = change(current)
+            pipe.multi()
+            if updated is None:
+                pipe.delete(self.KEY)
+            else:
+                updated.updated_at = time.time()
+                pipe.set(self.KEY, json.dumps(updated.as_dict()), ex=self.TTL)
+                self.__dict__.update(updated.as_dict())
+            return True
+
+        return self.redis.transaction(apply, self.KEY, value_from_callable=True)
+
+    @classmethod
+    def join(cls, run_id: str, now, connection=None):
+        """Starts run `run_id` planning for `now`, or adds `now` to the run already
+        in flight. A stale run is taken over by `run_id`, keeping its progress.
+        Returns the checkpoint and whether `run_id` now owns it
+        """
+        connection = connection or get_redis_connection()
+        window = [now.isoformat(), 0]
+
+        def apply(pipe):
+            checkpoint = cls._decode(pipe.get(cls.KEY), connection)
+            if checkpoint is None:
+                checkpoint = cls(run_id, [window], connection=connection)
+            elif checkpoint.run_id != run_id:
+                if window[0] not in {start for start, _ in checkpoint.windows}:
+                    checkpoint.windows.append(window)
+                if checkpoint.is_stale():
+                    # Its continuation was lost; carry on from its checkpoint.
+                    checkpoint.run_id, checkpoint.task_id, checkpoint.updated_at = run_id, None, time.time()
+            pipe.multi()
+            pipe.set(cls.KEY, json.dumps(checkpoint.as_dict()), ex=cls.TTL)
+            return checkpoint
+
+        checkpoint = connection.transaction(apply, cls.KEY, value_from_callable=True)
+        return checkpoint, checkpoint.run_id == run_id
+
+    def claim(self, task_id) -> bool:
+        """Records the task now working on the run, for progress lookups"""
+        def change(current):
+            current.task_id = task_id
+            return current
+        return self._update(change)
+
+    def advance(self, windows: list, last_user_id: int, count: int) -> bool:
+        """Marks `count` subscriptions of users up to `last_user_id` planned for
+        the given windows. Windows added since the batch was read are left alone
+        """
+        planned_for = {now for now, _ in windows}
+
+        def change(current):
+            current.windows = [
+                [now, max(after_id, last_user_id) if now in planned_for else after_id]
+                for now, after_id in current.windows
+            ]
+            current.planned += count
+            return current
+        return self._update(change)
+
+    def finish(self, windows: list) -> bool:
+        """Ends the run unless a window arrived after `windows` were read.
+        Returns whether the run is over
+        """
+        seen = {now for now, _ in windows}
+        ended = False
+
+        def change(current):
+            nonlocal ended
+            ended = {now for now, _ in current.windows} <= seen
+            return None if ended else current
+        return not self._update(change) or ended
@@ -3,16 +3,16 @@ from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from subscriptions.models import Subscription
+from ..exceptions import DeliveryError
+from .email_template import SOURCE_TEMPLATE, email_template_name
 
 
 logger = logging.getLogger(__name__)
 
-def send_weather_email(subscription: Subscription, weather_data: dict):
-    """Renders the weather email template with context and sends it"""
-    subject = f'Your Weather Update for {subscription.city}'
-
-    context = {
-        'city': subscription.city,
+def build_weather_report(city: str, weather_data: dict) -> dict:
+    """Extracts the fields shown in the weather email for a single city"""
+    return {
+        'city': city,
         'temperature': weather_data.get('main', {}).get('temp'),
         'feels_like': weather_data.get('main', {}).get('feels_like'),
         'description': weather_data.get('weather', [{}])[0].get('description', 'N/A').capitalize(),
@@ -20,17 +20,45 @@ def send_weather_email(subscription: Subscription, weather_data: dict):
         'wind_speed': weather_data.get('wind', {}).get('speed'),
     }
 
-    html_message = render_to_string('notifications/weather_email.html', context)
+def _send_html_email(subject: str, recipient: str, context: dict):
+    # The precompiled artifact: CSS already inlined, so nothing is done per send.
+    html_message = render_to_string(email_template_name(SOURCE_TEMPLATE), context)
 
     try:
         send_mail(
             subject=subject,
             message='',
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[subscription.user.email],
+            recipient_list=[recipient],
             html_message=html_message,
             fail_silently=False,
         )
-        logger.info(f'Successfully sent weather email to {subscription.user.email} for {subscription.city}')
-    except Exception:
-        logger.error(f'Error sending email to {subscription.user.email}', exc_info=True)
\ No newline at end of file
+    except Exception as exc:
+        logger.error(f'Error sending email to {recipient}', exc_info=True)
+        raise DeliveryError(f'Email to {recipient} failed: {exc}') from exc
+
+def send_weather_email(subscription: Subscription, weather_data: dict):
+    """Renders the weather email template with context and sends it.
+    Raises DeliveryError when the mail backend rejects the message
+    """
+    subject = f'Your Weather Update for {subscription.city}'
+    context = {
+        'city': subscription.city,
+        'reports': [build_weather_report(subscription.city, weather_data)],
+    }
+
+    _send_html_email(subject, subscription.user.email, context)
+    logger.info(f'Successfully sent weather email to {subscription.user.email} for {subscription.city}')
+
+def send_weather_digest_email(email: str, entries: list):
+    """Renders a single email covering several cities and sends it.
+    `entries` is a list of (subscription, weather_data) pairs for one user
+    """
+    cities = [sub.city for sub, _ in entries]
+    subject = f'Your Weather Digest for {", ".join(cities)}'
+    context = {
+        'reports': [build_weather_report(sub.city, weather_data) for sub, weather_data in entries],
+    }
+
+    _send_html_email(subject, email, context)
+    logger.info(f'Successfully sent weather digest to {email} for {len(cities)} cities')
@@ -0,0 +1,327 @@
+import hashlib
+import json
+import logging
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+from django.conf import settings
+from django.template.loader import get_template
+
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TEMPLATE = 'notifications/weather_email.html'
+COMPILED_PREFIX = 'notifications/compiled'
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+_TEMPLATE_SPAN = re.compile(r'({%.*?%}|{{.*?}})', re.DOTALL)
+_PLACEHOLDER = re.compile(r'\x00(\d+)\x00')
+_LOOP_START = re.compile(r'{%-?\s*for\b')
+_LOOP_END = re.compile(r'{%-?\s*endfor\b')
+_COMPOUND = re.compile(r'^(?P<tag>[a-z][a-z0-9]*)?(?P<classes>(?:\.[\w-]+)*)(?P<pseudo>(?::(?:first|last)-child)*)$')
+
+
+def compiled_dir():
+    return settings.BASE_DIR / 'templates' / COMPILED_PREFIX
+
+def source_digest(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class _Element:
+    def __init__(self, tag, attrs, parent=None, repeated=False):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.parent = parent
+        self.children = []
+        # Inside a {% for %}, so rendered once per iteration.
+        self.repeated = repeated or bool(parent and parent.repeated)
+
+    @property
+    def classes(self):
+        return set(self.attrs.get('class', '').split())
+
+    def siblings(self):
+        return [child for child in self.parent.children if isinstance(child, _Element)]
+
+
+class _TreeBuilder(HTMLParser):
+    """Parses the template source into a minimal element tree. Django tags and
+    variables are swapped for placeholders while parsing, so quotes or angle
+    brackets inside them cannot end an attribute or a tag, and come back
+    verbatim; elements between {% for %} and {% endfor %} are marked as repeated
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.spans = []
+        self.root = _Element(None, {})
+        self.current = self.root
+        self.doctype = None
+        self.styles = []
+        self.loop_depth = 0
+
+    def feed(self, data):
+        def protect(match):
+            self.spans.append(match.group())
+            return f'\x00{len(self.spans) - 1}\x00'
+        super().feed(_TEMPLATE_SPAN.sub(protect, data))
+
+    def _restore(self, text):
+        return _PLACEHOLDER.sub(lambda match: self.spans[int(match[1])], text) if text else text
+
+    def _element(self, tag, attrs):
+        attrs = [(name, self._restore(value)) for name, value in attrs]
+        return _Element(tag, attrs, self.current, repeated=self.loop_depth > 0)
+
+    def handle_decl(self, decl):
+        self.doctype = f'<!{decl}>'
+
+    def handle_starttag(self, tag, attrs):
+        element = self._element(tag, attrs)
+        self.current.children.append(element)
+        if tag not in VOID_ELEMENTS:
+            self.current = element
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(self._element(tag, attrs))
+
+    def handle_endtag(self, tag):
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        data = self._restore(data)
+        if self.current.tag == 'style':
+            self.styles.append(data)
+        else:
+            self.current.children.append(data)
+            self.loop_depth += len(_LOOP_START.findall(data)) - len(_LOOP_END.findall(data))
+
+    def handle_entityref(self, name):
+        self.current.children.append(f'&{name};')
+
+    def handle_charref(self, name):
+        self.current.children.append(f'&#{name};')
+
+
+def _parse_selector(selector):
+    """Returns the selector as a list of (tag, classes, pseudos) compounds joined
+    by descendant combinators, or None when it needs a browser to evaluate
+    """
+    compounds = []
+    for part in selector.split():
+        match = _COMPOUND.match(part)
+        if not match:
+            return None
+        compounds.append((
+            match['tag'],
+            set(filter(None, match['classes'].split('.'))),
+            set(filter(None, match['pseudo'].split(':'))),
+        ))
+    return compounds or None
+
+def _matches_compound(element, compound):
+    tag, classes, pseudos = compound
+    if tag and element.tag != tag:
+        return False
+    if not classes <= element.classes:
+        return False
+    if pseudos:
+        siblings = element.siblings()
+        if 'first-child' in pseudos and siblings[0] is not element:
+            return False
+        if 'last-child' in pseudos and siblings[-1] is not element:
+            return False
+    return True
+
+def _matches(element, compounds):
+    if not _matches_compound(element, compounds[-1]):
+        return False
+    ancestor, remaining = element.parent, compounds[:-1]
+    while remaining and ancestor is not None and ancestor.tag is not None:
+        if _matches_compound(ancestor, remaining[-1]):
+            remaining = remaining[:-1]
+        ancestor = ancestor.parent
+    return not remaining
+
+def _specificity(compounds):
+    return (
+        sum(len(classes) + len(pseudos) for _, classes, pseudos in compounds),
+        sum(1 for tag, _, _ in compounds if tag),
+    )
+
+def minify_css(css: str) -> str:
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};:,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+def _split_rules(css):
+    """Splits a stylesheet into inlinable (selector, compounds, declarations,
+    order) rules, the (order, rule) remainder that needs a browser (:hover and
+    the like) and the at-rules, which stay in <style> as they are
+    """
+    css = minify_css(css)
+    at_rules = re.findall(r'@[^{;]+(?:;|{(?:[^{}]*{[^{}]*})*[^{}]*})', css)
+    for at_rule in at_rules:
+        css = css.replace(at_rule, '')
+    inlinable, kept = [], []
+    for order, (selectors, body) in enumerate(re.findall(r'([^{}@]+){([^{}]*)}', css)):
+        declarations = [tuple(part.split(':', 1)) for part in body.split(';') if ':' in part]
+        for selector in selectors.split(','):
+            compounds = _parse_selector(selector)
+            if compounds is None:
+                kept.append((order, f'{selector}{{{body}}}'))
+            else:
+                inlinable.append((selector, compounds, declarations, order))
+    return inlinable, kept, ''.join(at_rules)
+
+def _elements(root):
+    stack = list(root.children)
+    while stack:
+        element = stack.pop()
+        if isinstance(element, _Element):
+            yield element
+            stack.extend(element.children)
+
+def _apply_styles(root, rules):
+    """Inlines the rules that only style elements rendered once. Rules matching
+    an element inside a loop are returned as (order, rule) to keep in <style>,
+    since inlining them would repeat their declarations on every iteration.
+    Elements outside loops still get those rules inline too, so the cascade
+    between kept and inlined rules is unchanged
+    """
+    rules = sorted(rules, key=lambda rule: (_specificity(rule[1]), rule[3]))
+    elements = list(_elements(root))
+    kept = [
+        (order, f'{selector}{{{";".join(f"{prop}:{value}" for prop, value in declarations)}}}')
+        for selector, compounds, declarations, order in rules
+        if any(element.repeated and _matches(element, compounds) for element in elements)
+    ]
+    for element in elements:
+        if element.repeated:
+            continue
+        styles = {}
+        for _, compounds, declarations, _ in rules:
+            if _matches(element, compounds):
+                styles.update(declarations)
+        if styles:
+            # Styles already written inline keep the last word, as in a browser.
+            inline = element.attrs.get('style') or ''
+            for prop, value in (part.split(':', 1) for part in inline.split(';') if ':' in part):
+                styles[prop.strip()] = value.strip()
+            # Single quotes (font names) keep the attribute free of &quot;.
+            element.attrs['style'] = ';'.join(
+                f'{prop}:{value}'.replace('"', "'") for prop, value in styles.items()
+            )
+    return kept
+
+def _drop_inlined_classes(root, css):
+    """Removes the classes no rule left in <style> refers to, as their styles
+    are all inline now. Classes set by template tags are left alone
+    """
+    used = set(re.findall(r'\.([\w-]+)', css))
+    for element in _elements(root):
+        classes = element.attrs.get('class')
+        if classes is None or '{' in classes:
+            continue
+        remaining = [name for name in classes.split() if name in used]
+        if remaining:
+            element.attrs['class'] = ' '.join(remaining)
+        else:
+            del element.attrs['class']
+
+def _minify_text(text):
+    # Template tags render nothing or a single value, so whitespace is only
+    # collapsed, never dropped, inside text.
+    return re.sub(r'\s+', ' ', text)
+
+def _escape_attr(value):
+    # Only what closes the attribute, and never inside template tags, whose
+    # quoted arguments ({% url "home" %}) must reach the template engine intact.
+    return ''.join(
+        part if index % 2 else part.replace('&', '&amp;').replace('"', '&quot;')
+        for index, part in enumerate(_TEMPLATE_SPAN.split(value))
+    )
+
+def _serialize(element, out, kept_css):
+    for child in element.children:
+        if isinstance(child, str):
+            out.append(_minify_text(child))
+            continue
+        if child.tag == 'style':
+            if kept_css:
+                out.append(f'<style>{kept_css}</style>')
+            continue
+        attrs = ''.join(
+            f' {name}' if value is None else f' {name}="{_escape_attr(value)}"'
+            for name, value in child.attrs.items()
+        )
+        out.append(f'<{child.tag}{attrs}>')
+        if child.tag not in VOID_ELEMENTS:
+            _serialize(child, out, kept_css)
+            out.append(f'</{child.tag}>')
+
+def compile_email_html(source: str) -> str:
+    """Inlines the <style> rules into style attributes and strips the whitespace
+    between tags. A minified <style> block keeps what needs a browser (at-rules,
+    :hover) and the rules for elements inside loops, which a digest would
+    otherwise repeat per city; classes only inlined rules used are dropped.
+    The result is still a Django template
+    """
+    builder = _TreeBuilder()
+    builder.feed(source)
+    builder.close()
+    rules, kept, at_rules = _split_rules(''.join(builder.styles))
+    kept += _apply_styles(builder.root, rules)
+    kept_css = ''.join(rule for _, rule in sorted(kept, key=lambda item: item[0])) + at_rules
+    _drop_inlined_classes(builder.root, kept_css)
+
+    out = [builder.doctype or '']
+    _serialize(builder.root, out, kept_css)
+    html = ''.join(out)
+    html = re.sub(r'>\s+<', '><', html)
+    # Indentation between a tag and a template tag; space between two template
+    # tags may be rendered text, so it stays.
+    html = re.sub(r'>\s+{%', '>{%', html)
+    html = re.sub(r'%}\s+<', '%}<', html)
+    return html.strip()
+
+
+def build_artifact(name: str = SOURCE_TEMPLATE) -> dict:
+    """Compiles a template and returns its manifest entry and compiled source,
+    named by content hash so a deploy never serves a stale artifact
+    """
+    source = get_template(name).template.source
+    compiled = compile_email_html(source)
+    stem = name.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+    return {
+        'name': f'{COMPILED_PREFIX}/{stem}.{source_digest(compiled)[:12]}.html',
+        'source_sha256': source_digest(source),
+        'compiled': compiled,
+    }
+
+def read_manifest() -> dict:
+    try:
+        return json.loads((compiled_dir() / 'manifest.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+@lru_cache(maxsize=None)
+def email_template_name(name: str = SOURCE_TEMPLATE) -> str:
+    """Returns the compiled artifact to render for `name`, resolved once per
+    process. Falls back to the source template, with a warning, when the
+    artifact is missing or was built from an older version of the source
+    """
+    entry = read_manifest().get(name)
+    if entry is None:
+        logger.warning(f'No compiled artifact for {name}; run `manage.py compile_email_templates`')
+        return name
+    if entry['source_sha256'] != source_digest(get_template(name).template.source):
+        logger.warning(f'Compiled artifact for {name} is stale; run `manage.py compile_email_templates`')
+        return name
+    return entry['name']
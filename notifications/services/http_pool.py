@@ -0,0 +1,59 @@
+import threading
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    """Returns the process-wide session used for outbound deliveries.
+    Keeping connections alive between calls matters most on a gevent or eventlet
+    pool, where hundreds of deliveries share one process; the pool is sized by
+    DELIVERY_HTTP_POOL_SIZE so concurrent greenlets don't discard connections
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.DELIVERY_HTTP_POOL_SIZE,
+                pool_maxsize=settings.DELIVERY_HTTP_POOL_SIZE,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+def green_pool_library():
+    """Returns 'gevent' or 'eventlet' when sockets are monkey-patched, else None"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('socket'):
+            return 'gevent'
+    except ImportError:
+        pass
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('socket'):
+            return 'eventlet'
+    except ImportError:
+        pass
+    return None
+
+def in_green_pool() -> bool:
+    return green_pool_library() is not None
+
+def release_db_connection():
+    """Gives the database connection back before a long network wait.
+    Each greenlet owns its own connection, so on a green pool a delivery holding
+    one across an HTTP call would need as many connections as the concurrency
+    setting. Prefork workers keep theirs for reuse as usual
+    """
+    if in_green_pool():
+        connection.close()
+    else:
+        close_old_connections()
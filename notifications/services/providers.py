@@ -0,0 +1,163 @@
+import logging
+import zlib
+from abc import ABC, abstractmethod
+import requests
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+class WeatherProviderError(Exception):
+    """Raised when a provider cannot return a reading"""
+
+
+class QuotaExceeded(WeatherProviderError):
+    """Raised when the shared quota refuses a call. `retry_after` is the wait in
+    seconds before the budget allows another, or None when today's is spent
+    """
+
+    def __init__(self, retry_after=None):
+        self.retry_after = retry_after
+        super().__init__(
+            'OpenWeatherMap daily quota exhausted' if retry_after is None
+            else f'OpenWeatherMap rate limited for {retry_after:.0f}s'
+        )
+
+
+class WeatherProvider(ABC):
+    """A source of current weather readings.
+    Implementations return readings in the OpenWeatherMap response shape
+    (`main`, `weather`, `wind`), which is what the senders consume
+    """
+    name = None
+    timeout = 10
+
+    def __init__(self, quota=None):
+        # Only providers with a metered API key use the shared quota.
+        self.quota = quota
+
+    @abstractmethod
+    def get_by_city(self, city: str) -> dict:
+        """Returns the current reading for a city name"""
+
+    @abstractmethod
+    def get_by_coords(self, latitude: float, longitude: float) -> dict:
+        """Returns the current reading at a point"""
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    name = 'openweathermap'
+    BASE_URL = 'https://api.openweathermap.org/data/2.5/weather'
+
+    def __init__(self, quota=None):
+        super().__init__(quota)
+        self.api_key = settings.OPENWEATHERMAP_API_KEY
+        if not self.api_key:
+            raise ValueError('OPENWEATHERMAP_API_KEY is not set in environment variables.')
+
+    def get_by_city(self, city: str) -> dict:
+        return self._get({'q': city})
+
+    def get_by_coords(self, latitude: float, longitude: float) -> dict:
+        return self._get({'lat': latitude, 'lon': longitude})
+
+    def _get(self, query: dict) -> dict:
+        if self.quota and not self.quota.acquire():
+            raise QuotaExceeded(self.quota.retry_after())
+
+        params = {
+            **query,
+            'appid': self.api_key,
+            'units': 'metric'  # Or 'imperial'
+        }
+        try:
+            response = requests.get(self.BASE_URL, params=params, timeout=self.timeout)
+            if response.status_code == 429 and self.quota:
+                self.quota.record_rate_limited(response.headers.get('Retry-After'))
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as exc:
+            raise WeatherProviderError(str(exc)) from exc
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """Open-Meteo needs no API key; city names are resolved with its geocoding API"""
+    name = 'open-meteo'
+    GEOCODING_URL = 'https://geocoding-api.open-meteo.com/v1/search'
+    FORECAST_URL = 'https://api.open-meteo.com/v1/forecast'
+
+    # WMO weather interpretation codes used by Open-Meteo.
+    DESCRIPTIONS = {
+        0: 'clear sky', 1: 'mainly clear', 2: 'partly cloudy', 3: 'overcast',
+        45: 'fog', 48: 'depositing rime fog',
+        51: 'light drizzle', 53: 'drizzle', 55: 'dense drizzle',
+        56: 'light freezing drizzle', 57: 'freezing drizzle',
+        61: 'light rain', 63: 'moderate rain', 65: 'heavy rain',
+        66: 'light freezing rain', 67: 'freezing rain',
+        71: 'light snow', 73: 'moderate snow', 75: 'heavy snow', 77: 'snow grains',
+        80: 'light rain showers', 81: 'rain showers', 82: 'violent rain showers',
+        85: 'light snow showers', 86: 'heavy snow showers',
+        95: 'thunderstorm', 96: 'thunderstorm with light hail', 99: 'thunderstorm with heavy hail',
+    }
+
+    def get_by_city(self, city: str) -> dict:
+        results = self._get(self.GEOCODING_URL, {'name': city, 'count': 1}).get('results')
+        if not results:
+            raise WeatherProviderError(f'Open-Meteo could not geocode {city}')
+        return self.get_by_coords(results[0]['latitude'], results[0]['longitude'])
+
+    def get_by_coords(self, latitude: float, longitude: float) -> dict:
+        current = self._get(self.FORECAST_URL, {
+            'latitude': latitude,
+            'longitude': longitude,
+            'current': 'temperature_2m,apparent_temperature,relative_humidity_2m,wind_speed_10m,weather_code',
+            'wind_speed_unit': 'ms',
+        }).get('current', {})
+        return {
+            'main': {
+                'temp': current.get('temperature_2m'),
+                'feels_like': current.get('apparent_temperature'),
+                'humidity': current.get('relative_humidity_2m'),
+            },
+            'weather': [{'description': self.DESCRIPTIONS.get(current.get('weather_code'), 'N/A')}],
+            'wind': {'speed': current.get('wind_speed_10m')},
+            'coord': {'lat': latitude, 'lon': longitude},
+        }
+
+    def _get(self, url: str, params: dict) -> dict:
+        try:
+            response = requests.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as exc:
+            raise WeatherProviderError(str(exc)) from exc
+
+
+class FakeWeatherProvider(WeatherProvider):
+    """Deterministic readings without network access, for local development and load tests"""
+    name = 'fake'
+
+    def get_by_city(self, city: str) -> dict:
+        return self._reading(city.casefold())
+
+    def get_by_coords(self, latitude: float, longitude: float) -> dict:
+        return self._reading(f'{latitude:.2f},{longitude:.2f}')
+
+    def _reading(self, seed: str) -> dict:
+        value = zlib.crc32(seed.encode())
+        temp = round(value % 400 / 10 - 5, 1)
+        return {
+            'main': {'temp': temp, 'feels_like': round(temp - 1.5, 1), 'humidity': value % 60 + 30},
+            'weather': [{'description': ('clear sky', 'scattered clouds', 'light rain', 'snow')[value % 4]}],
+            'wind': {'speed': round(value % 150 / 10, 1)},
+        }
+
+
+PROVIDERS = {
+    provider.name: provider
+    for provider in (OpenWeatherMapProvider, OpenMeteoProvider, FakeWeatherProvider)
+}
+
+def build_providers(quota=None) -> list:
+    """Instantiates the WEATHER_PROVIDERS in priority order"""
+    return [PROVIDERS[name](quota=quota) for name in settings.WEATHER_PROVIDERS]
@@ -0,0 +1,107 @@
+import json
+import logging
+import time
+from django.conf import settings
+from project.redis_client import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+class WeatherQuota:
+    """Shared OpenWeatherMap call budget kept in Redis, so every worker draws
+    from the same daily and per-minute allowance.
+
+    The per-minute limit adapts: a 429 halves it for OPENWEATHERMAP_BACKOFF_WINDOW
+    seconds and blocks all calls until its Retry-After has passed. The latest
+    reading per city is cached so callers can fall back to it when a call is
+    refused or fails
+    """
+    PREFIX = 'weather:quota'
+
+    def __init__(self, connection, daily_limit: int, minute_limit: int):
+        self.redis = connection
+        self.daily_limit = daily_limit
+        self.minute_limit = minute_limit
+
+    @classmethod
+    def from_settings(cls):
+        """Returns the configured quota, or None when no daily budget is set"""
+        if not settings.OPENWEATHERMAP_DAILY_QUOTA:
+            return None
+        return cls(
+            get_redis_connection(),
+            settings.OPENWEATHERMAP_DAILY_QUOTA,
+            settings.OPENWEATHERMAP_CALLS_PER_MINUTE,
+        )
+
+    def _key(self, *parts) -> str:
+        return ':'.join([self.PREFIX, *map(str, parts)])
+
+    def current_minute_limit(self) -> int:
+        reduced = self.redis.get(self._key('minute_limit'))
+        return int(reduced) if reduced else self.minute_limit
+
+    def remaining_today(self) -> int:
+        used = self.redis.get(self._key('day', time.strftime('%Y%m%d', time.gmtime())))
+        return max(0, self.daily_limit - int(used or 0))
+
+    def acquire(self) -> bool:
+        """Reserves one call, returning False when backing off or out of budget.
+        A refused call hands its reservation back, so it costs no budget
+        """
+        if self.redis.exists(self._key('backoff')):
+            return False
+
+        now = time.time()
+        day_key = self._key('day', time.strftime('%Y%m%d', time.gmtime(now)))
+        minute_key = self._key('minute', int(now // 60))
+        with self.redis.pipeline() as pipe:
+            pipe.incr(day_key)
+            pipe.expire(day_key, 2 * 24 * 3600)
+            pipe.incr(minute_key)
+            pipe.expire(minute_key, 120)
+            used_today, _, used_this_minute, _ = pipe.execute()
+
+        if used_today <= self.daily_limit and used_this_minute <= self.current_minute_limit():
+            return True
+        with self.redis.pipeline() as pipe:
+            pipe.decr(day_key)
+            pipe.decr(minute_key)
+            pipe.execute()
+        return False
+
+    def retry_after(self):
+        """Seconds until a refused call may be tried again: the end of a 429
+        pause or of the current minute. None once today's budget is spent
+        """
+        if not self.remaining_today():
+            return None
+        backoff = self.redis.ttl(self._key('backoff'))
+        if backoff > 0:
+            return backoff
+        return 60 - time.time() % 60
+
+    def record_rate_limited(self, retry_after: int = None):
+        """Honours a 429: pause all calls and halve the per-minute limit for a while"""
+        try:
+            retry_after = max(1, int(retry_after))
+        except (TypeError, ValueError):  # Missing, or an HTTP date
+            retry_after = settings.OPENWEATHERMAP_DEFAULT_RETRY_AFTER
+        reduced = max(1, self.current_minute_limit() // 2)
+        with self.redis.pipeline() as pipe:
+            pipe.set(self._key('backoff'), 1, ex=retry_after)
+            pipe.set(self._key('minute_limit'), reduced, ex=settings.OPENWEATHERMAP_BACKOFF_WINDOW)
+            pipe.execute()
+        logger.warning(f'OpenWeatherMap rate limit hit: pausing {retry_after}s, limit now {reduced}/min')
+
+    def store_reading(self, label: str, weather_data: dict):
+        self.redis.set(
+            self._key('last', label.casefold()),
+            json.dumps(weather_data),
+            ex=settings.OPENWEATHERMAP_FALLBACK_TTL,
+        )
+
+    def cached_reading(self, label: str):
+        """Returns the most recent stored reading for a city, or None"""
+        cached = self.redis.get(self._key('last', label.casefold()))
+        return json.loads(cached) if cached else None
@@ -0,0 +1,52 @@
+import json
+from django.conf import settings
+from project.redis_client import get_redis_connection
+
+
+class WeatherReadings:
+    """Readings fetched during one notification run, published to Redis so
+    delivery tasks carry only a run id instead of the weather payload.
+
+    The weather stage writes every city in a single pipelined MSET with one
+    EXPIRE per key; each delivery reads its cities back with one MGET
+    """
+    PREFIX = 'weather:reading'
+
+    def __init__(self, run_id: str, connection=None):
+        self.run_id = run_id
+        self.redis = connection or get_redis_connection()
+
+    def _key(self, city: str) -> str:
+        return f'{self.PREFIX}:{self.run_id}:{city.casefold()}'
+
+    def publish(self, readings: dict):
+        """Stores city -> reading for WEATHER_READING_TTL seconds"""
+        if not readings:
+            return
+        values = {self._key(city): json.dumps(data) for city, data in readings.items()}
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.mset(values)
+            for key in values:
+                pipe.expire(key, settings.WEATHER_READING_TTL)
+            pipe.execute()
+
+    def load(self, cities, max_age: int = None) -> dict:
+        """Returns city -> reading for the given cities that are still stored,
+        or only those published at most `max_age` seconds ago
+        """
+        cities = list(cities)
+        if not cities:
+            return {}
+        keys = [self._key(city) for city in cities]
+        if max_age is None:
+            values = self.redis.mget(keys)
+        else:
+            with self.redis.pipeline(transaction=False) as pipe:
+                pipe.mget(keys)
+                for key in keys:
+                    pipe.ttl(key)
+                values, *ttls = pipe.execute()
+            # A reading's age is how far its TTL has run down since publishing.
+            fresh_after = settings.WEATHER_READING_TTL - max_age
+            values = [value if ttl >= fresh_after else None for value, ttl in zip(values, ttls)]
+        return {city: json.loads(value) for city, value in zip(cities, values) if value is not None}
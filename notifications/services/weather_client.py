@@ -1,31 +1,142 @@
 import logging
-import requests
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from django.conf import settings
+from .providers import QuotaExceeded, WeatherProviderError, build_providers
 
 
 logger = logging.getLogger(__name__)
 
+# Shared by all clients in the process; hedged requests that lose the race
+# finish here in the background.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='weather-hedge')
+
+
+class LatencyTracker:
+    """Rolling window of a provider's response times"""
+    MIN_SAMPLES = 20
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        """Returns the 95th percentile, or None until enough samples exist"""
+        with self._lock:
+            if len(self._samples) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+_latency = {}
+
+def _tracker(provider) -> LatencyTracker:
+    return _latency.setdefault(provider.name, LatencyTracker())
+
+
 class WeatherClient:
-    BASE_URL = 'https://api.openweathermap.org/data/2.5/weather'
+    """Fetches readings from the configured WEATHER_PROVIDERS.
+
+    Providers are tried in order. With WEATHER_HEDGING enabled, a request to the
+    second provider is fired once the primary has taken longer than its p95
+    latency (WEATHER_HEDGE_DELAY until enough samples exist), and whichever
+    answers first wins. When every provider fails, the last reading cached by
+    the quota is returned, if any. With `defer_throttled`, a lookup the quota
+    only refused for now raises the `QuotaExceeded` instead, so the caller can
+    try again once the budget allows; the cached reading is kept for when
+    the daily budget is spent
+    """
 
-    def __init__(self):
-        self.api_key = settings.OPENWEATHERMAP_API_KEY
-        if not self.api_key:
-            raise ValueError('OPENWEATHERMAP_API_KEY is not set in environment variables.')
+    def __init__(self, quota=None, providers=None, defer_throttled=False):
+        self.quota = quota
+        self.providers = providers if providers is not None else build_providers(quota)
+        self.defer_throttled = defer_throttled
 
     def get_weather(self, city: str):
         """Fetches the current weather for a given city.
-        Returns the JSON response or None if an error occurs
+        Returns the reading or None if an error occurs
         """
-        params = {
-            'q': city,
-            'appid': self.api_key,
-            'units': 'metric'  # Or 'imperial'
-        }
-        try:
-            response = requests.get(self.BASE_URL, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException:
-            logger.warning(f'Error fetching weather for city: {city}', exc_info=True)
-            return None
\ No newline at end of file
+        return self._fetch(city, lambda provider: provider.get_by_city(city))
+
+    def get_weather_by_coords(self, latitude: float, longitude: float):
+        """Fetches the current weather at a coordinate.
+        Returns the reading or None if an error occurs
+        """
+        return self._fetch(
+            f'{latitude:.4f},{longitude:.4f}',
+            lambda provider: provider.get_by_coords(latitude, longitude),
+        )
+
+    def _fetch(self, label: str, call):
+        refusals = []
+        if settings.WEATHER_HEDGING and len(self.providers) > 1:
+            weather_data = self._hedged(label, call, refusals)
+        else:
+            weather_data = self._sequential(label, call, refusals)
+
+        if weather_data is None:
+            throttled = [refusal for refusal in refusals if refusal.retry_after is not None]
+            if self.defer_throttled and throttled:
+                raise max(throttled, key=lambda refusal: refusal.retry_after)
+            return self.quota.cached_reading(label) if self.quota else None
+        if self.quota:
+            self.quota.store_reading(label, weather_data)
+        return weather_data
+
+    def _timed_call(self, provider, call):
+        started = time.monotonic()
+        result = call(provider)
+        _tracker(provider).record(time.monotonic() - started)
+        return result
+
+    def _failed(self, label: str, provider, error: WeatherProviderError, refusals: list):
+        if isinstance(error, QuotaExceeded):
+            # Expected once the budget runs low, so no traceback.
+            logger.info(f'Weather for {label} not fetched from {provider.name}: {error}')
+            refusals.append(error)
+        else:
+            logger.warning(f'Error fetching weather for city: {label} from {provider.name}', exc_info=True)
+
+    def _sequential(self, label: str, call, refusals: list, providers=None):
+        for provider in self.providers if providers is None else providers:
+            try:
+                return self._timed_call(provider, call)
+            except WeatherProviderError as error:
+                self._failed(label, provider, error, refusals)
+        return None
+
+    def _hedged(self, label: str, call, refusals: list):
+        primary, secondary = self.providers[:2]
+        delay = _tracker(primary).p95() or settings.WEATHER_HEDGE_DELAY
+
+        primary_future = _executor.submit(self._timed_call, primary, call)
+        pending = {primary_future: primary}
+        done, _ = wait(pending, timeout=delay)
+        if done:
+            pending.clear()
+            try:
+                return primary_future.result()
+            except WeatherProviderError as error:
+                self._failed(label, primary, error, refusals)
+        else:
+            logger.info(f'Hedging weather request for {label} to {secondary.name} after {delay:.2f}s')
+        pending[_executor.submit(self._timed_call, secondary, call)] = secondary
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    return future.result()
+                except WeatherProviderError as error:
+                    self._failed(label, provider, error, refusals)
+
+        # Both raced providers failed; try any remaining ones in order.
+        return self._sequential(label, call, refusals, self.providers[2:])
@@ -1,13 +1,18 @@
 import logging
 import json
 import requests
+from django.conf import settings
 from subscriptions.models import Subscription
+from ..exceptions import DeliveryError
+from .http_pool import get_http_session
 
 
 logger = logging.getLogger(__name__)
 
 def send_weather_webhook(subscription: Subscription, weather_data: dict):
-    """Formats a JSON payload and sends it to the subscription's webhook URL"""
+    """Formats a JSON payload and sends it to the subscription's webhook URL.
+    Raises DeliveryError when the endpoint is unreachable or answers with an error
+    """
     if not subscription.webhook_url:
         logger.warning(f'Skipping webhook for subscription {subscription.id}: No URL provided.')
         return
@@ -29,8 +34,11 @@ def send_weather_webhook(subscription: Subscription, weather_data: dict):
 
     try:
         headers = {'Content-Type': 'application/json'}
-        response = requests.post(subscription.webhook_url, data=json.dumps(payload), headers=headers, timeout=10)
+        response = get_http_session().post(
+            subscription.webhook_url, data=json.dumps(payload), headers=headers, timeout=settings.WEBHOOK_TIMEOUT
+        )
         response.raise_for_status()
         logger.info(f'Successfully sent webhook to {subscription.webhook_url} for {subscription.city}')
-    except requests.exceptions.RequestException:
-        logger.error(f'Error sending webhook to {subscription.webhook_url}', exc_info=True)
\ No newline at end of file
+    except requests.exceptions.RequestException as exc:
+        logger.error(f'Error sending webhook to {subscription.webhook_url}', exc_info=True)
+        raise DeliveryError(f'Webhook to {subscription.webhook_url} failed: {exc}') from exc
\ No newline at end of file
@@ -1,98 +1,459 @@
 import logging
-import os  # <-- ADD THIS IMPORT
+import time
+import uuid
+from collections import Counter, defaultdict
 from datetime import timedelta
+from functools import partial, reduce
+from itertools import groupby
+from operator import itemgetter, or_
 from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.db.models import BooleanField, ExpressionWrapper, Q
 from django.utils import timezone
+from subscriptions.cities import city_index, geohash_center
 from subscriptions.models import Subscription
-from .services.email_sender import send_weather_email
-from .services.weather_client import WeatherClient
-from .services.webhook_sender import send_weather_webhook
+from subscriptions.schedule import SCHEDULE_FIELDS, DueSchedule, is_testing_schedule, schedule_subscriptions
+from .exceptions import DeliveryError
+from .models import FailedDelivery
+from .services.change_detection import has_significant_change, weather_fingerprint
+from .services.checkpoint import PlannerCheckpoint
+from .services.http_pool import release_db_connection
+from .services.quota import WeatherQuota
+from .services.readings import WeatherReadings
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def process_and_send_notifications():
-    """The main periodic task, optimized to fetch weather for each city only once.
-    Adapts its scheduling logic based on environment variables for testing.
+# The weather client and senders pull in requests, urllib3 and the template
+# engine. They are imported where used so the planner and web processes that
+# import this module stay light; worker processes load them once up front in
+# `project.celery.warm_up_worker` before forking their pool.
+
+def _due_filter(now, is_testing_mode: bool) -> Q:
+    """Builds the database filter selecting active subscriptions due at `now`.
+    Matches the partial (notification_period, last_checked_at) index on
+    active subscriptions so the scan never touches inactive rows. It goes by
+    when the planner last handled a subscription rather than when it was last
+    notified, so one skipped as unchanged waits for its next period too
     """
-    now = timezone.now()
+    if is_testing_mode:
+        # --- TESTING LOGIC ---
+        # In testing mode, send if ~15 minutes have passed since the last check.
+        # We use 14 minutes as a buffer to prevent race conditions with the scheduler.
+        not_checked_recently = now - timedelta(minutes=14)
+        return Q(last_checked_at__isnull=True) | Q(last_checked_at__lte=not_checked_recently)
 
-    # --- START OF MODIFIED SECTION ---
+    # --- PRODUCTION LOGIC ---
+    # A subscription is scheduled when the current hour is a multiple of its period.
+    scheduled_periods = [
+        period for period in Subscription.NotificationPeriod.values
+        if now.hour % period == 0
+    ]
+    # Skip anything checked in the last 59 minutes. This is a simpler and more
+    # robust way to prevent duplicates and handle the off-by-one error.
+    not_checked_recently = now - timedelta(minutes=59)
+    return Q(notification_period__in=scheduled_periods) & (
+        Q(last_checked_at__isnull=True) | Q(last_checked_at__lte=not_checked_recently)
+    )
 
-    # Check if we are in a custom testing schedule by looking for the env var.
-    is_testing_mode = os.getenv('CELERY_BEAT_MINUTE_SCHEDULE') is not None
+def _due_from_schedule(schedule: DueSchedule, now, due: Q) -> list:
+    """Returns (id, city, user_id) of due subscriptions, reading candidates from
+    the Redis due schedule instead of scanning the table. Candidates are
+    confirmed against the database with the `due` filter; ones no longer
+    active are dropped from the schedule
+    """
+    if not schedule.exists():
+        logger.info(f'Rebuilt the due schedule with {schedule.rebuild()} subscriptions.')
 
-    logger.info(f"Running optimized notification task (Testing Mode: {is_testing_mode})")
+    candidates = schedule.due_ids(now)
+    is_due = ExpressionWrapper(due, output_field=BooleanField())
+    due_subscriptions, active = [], set()
+    for start in range(0, len(candidates), schedule.BATCH_SIZE):
+        rows = (
+            Subscription.objects.filter(id__in=candidates[start:start + schedule.BATCH_SIZE], is_active=True)
+            .annotate(is_due=is_due)
+            .values_list('id', 'city', 'user_id', 'is_due')
+        )
+        for subscription_id, city, user_id, subscription_is_due in rows:
+            active.add(subscription_id)
+            if subscription_is_due:
+                due_subscriptions.append((subscription_id, city, user_id))
 
-    active_subscriptions = Subscription.objects.filter(is_active=True)
-    if not active_subscriptions:
-        logger.info("No active subscriptions to process.")
-        return "Task complete: No active subscriptions."
+    schedule.remove(set(candidates) - active)
+    return due_subscriptions
 
-    due_subscriptions = []
-    cities_to_fetch = set()
+def _fetch_weather(weather_client, city_counts: Counter):
+    """Fetches weather for each city, returning a map of city -> reading and a
+    map of city -> seconds to wait for the cities the quota deferred.
+    `city_counts` maps each city to its number of due subscriptions; the most
+    subscribed locations are fetched first so they win when the quota runs low.
+    That order holds within one planner batch only: batches go user by user,
+    so a busy city in a later batch may still wait behind quieter ones.
+    With WEATHER_GRID_PRECISION set, cities sharing a grid cell are served by a
+    single coordinate lookup at the cell centre; a city alone in its cell is
+    looked up at its own coordinates
+    """
+    from .services.providers import QuotaExceeded
 
-    for sub in active_subscriptions:
-        if is_testing_mode:
-            # --- TESTING LOGIC ---
-            # In testing mode, send if ~15 minutes have passed since the last notification.
-            # We use 14 minutes as a buffer to prevent race conditions with the scheduler.
-            is_due = (
-                sub.last_notified_at is None or
-                sub.last_notified_at <= now - timedelta(minutes=14)
-            )
+    fetches = []
+    cities_by_cell = defaultdict(list)
+    for city in city_counts:
+        cell = city_index.cell_for(city) if settings.WEATHER_GRID_PRECISION else None
+        if cell:
+            cities_by_cell[cell].append(city)
         else:
-            # --- PRODUCTION LOGIC (Corrected) ---
-            current_hour = now.hour
-            is_scheduled_hour = (current_hour % sub.notification_period) == 0
+            fetches.append((city_counts[city], [city], partial(weather_client.get_weather, city)))
 
-            sent_since_last_run = False
-            if sub.last_notified_at:
-                # Check if a notification has been sent in the last 59 minutes.
-                # This is a simpler and more robust way to prevent duplicates
-                # and handle the off-by-one error.
-                if sub.last_notified_at > now - timedelta(minutes=59):
-                    sent_since_last_run = True
+    for cell, cell_cities in cities_by_cell.items():
+        subscribers = sum(city_counts[city] for city in cell_cities)
+        if len(cell_cities) == 1:
+            coordinates = city_index.coordinates_for(cell_cities[0])
+        else:
+            coordinates = geohash_center(cell)
+        fetches.append((subscribers, cell_cities, partial(weather_client.get_weather_by_coords, *coordinates)))
+
+    weather_data_map, deferred = {}, {}
+    for _, cities, fetch in sorted(fetches, key=lambda item: item[0], reverse=True):
+        if len(cities) > 1:
+            logger.info(f'Fetching one shared grid reading for {cities}')
+        try:
+            weather_data = fetch()
+        except QuotaExceeded as refusal:
+            deferred.update(dict.fromkeys(cities, refusal.retry_after))
+            continue
+        for city in cities:
+            weather_data_map[city] = weather_data
+    return weather_data_map, deferred
+
+def _user_batches(rows, size: int):
+    """Splits (id, city, user_id) rows ordered by user into batches of about
+    `size`, never splitting a user, so a digest covers all of a user's cities
+    """
+    batch = []
+    for _, user_rows in groupby(rows, key=itemgetter(2)):
+        user_rows = list(user_rows)
+        if batch and len(batch) + len(user_rows) > size:
+            yield batch
+            batch = []
+        batch.extend(user_rows)
+    if batch:
+        yield batch
+
+def _due_batches(checkpoint: PlannerCheckpoint, schedule, is_testing_mode: bool):
+    """Yields batches of (id, city, user_id) due in any window of the run, in
+    user order from each window's checkpoint, about PLANNER_BATCH_SIZE at a time
+    """
+    windows = checkpoint.due_windows()
+    due = reduce(or_, (
+        Q(user_id__gt=after_user_id) & _due_filter(now, is_testing_mode) for now, after_user_id in windows
+    ))
+    size = settings.PLANNER_BATCH_SIZE
+    if schedule is not None:
+        # Candidates come by subscription id, so confirm them all once per task.
+        latest = max(now for now, _ in windows)
+        yield from _user_batches(sorted(_due_from_schedule(schedule, latest, due), key=itemgetter(2, 0)), size)
+        return
 
-            is_due = is_scheduled_hour and not sent_since_last_run
+    due_subscriptions = Subscription.objects.filter(is_active=True).filter(due).order_by('user_id', 'id')
+    after_user_id = 0
+    while True:
+        # One row past the batch shows whether its last user continues beyond it;
+        # `_user_batches` leaves a user cut off by the limit for the next query.
+        rows = list(due_subscriptions.filter(user_id__gt=after_user_id).values_list('id', 'city', 'user_id')[:size + 1])
+        if not rows:
+            return
+        batch = next(_user_batches(rows, size))
+        if len(batch) > size:
+            # A single user with more due subscriptions than a batch holds.
+            batch = list(due_subscriptions.filter(user_id=batch[0][2]).values_list('id', 'city', 'user_id'))
+        yield batch
+        after_user_id = batch[-1][2]
 
-        if is_due:
-            due_subscriptions.append(sub)
-            cities_to_fetch.add(sub.city)
+def _report_progress(task, checkpoint: PlannerCheckpoint):
+    # Eager and direct calls keep no results, as Celery does for eager tasks.
+    if task.request.id and not task.request.is_eager:
+        task.update_state(state='PROGRESS', meta={
+            'run_id': checkpoint.run_id,
+            'planned': checkpoint.planned,
+            'windows': checkpoint.windows,
+        })
 
-    # --- END OF MODIFIED SECTION ---
+def _continue_later(task, checkpoint: PlannerCheckpoint) -> str:
+    continuation = task.apply_async(kwargs={'run_id': checkpoint.run_id})
+    message = (f'Task paused: Planned {checkpoint.planned} due subscriptions so far; '
+               f'run {checkpoint.run_id} continues in task {continuation.id}.')
+    logger.info(message)
+    return message
 
-    if not due_subscriptions:
+@shared_task(bind=True, soft_time_limit=settings.PLANNER_RUN_BUDGET)
+def process_and_send_notifications(self, run_id: str = None):
+    """The main periodic task: plans the run and hands it to the weather stage.
+    Adapts its scheduling logic to SUBSCRIPTION_TESTING_SCHEDULE for testing.
+    Due subscriptions are planned in user order, about PLANNER_BATCH_SIZE at a
+    time and never splitting a user, each batch going to one
+    `fetch_weather_and_dispatch`, which fetches weather once per city and fans
+    out one delivery task per notification.
+
+    A run stops before its PLANNER_RUN_BUDGET (also the task's soft time limit)
+    runs out and re-enqueues itself with its run id. Progress lives in a Redis
+    `PlannerCheckpoint` and is reported to the result backend as PROGRESS, so a
+    continuation, or a redelivery after a worker dies, resumes after the last
+    planned user. A beat tick that finds a run in flight adds its own
+    due window to it, and takes the run over if it has stalled
+    """
+    # Check if we are in the custom testing schedule.
+    is_testing_mode = is_testing_schedule()
+
+    if run_id is None:
+        logger.info(f"Running optimized notification task (Testing Mode: {is_testing_mode})")
+        if not Subscription.objects.filter(is_active=True).exists():
+            logger.info("No active subscriptions to process.")
+            return "Task complete: No active subscriptions."
+        # A redelivered beat message keeps its task id and so resumes its own run.
+        checkpoint, is_own_run = PlannerCheckpoint.join(self.request.id or uuid.uuid4().hex, timezone.now())
+        if not is_own_run:
+            message = f'Task complete: Added this window to run {checkpoint.run_id} in flight.'
+            logger.info(message)
+            return message
+    else:
+        checkpoint = PlannerCheckpoint.load()
+        if checkpoint is None or checkpoint.run_id != run_id:
+            return f'Task complete: Run {run_id} already finished.'
+
+    checkpoint.claim(self.request.id)
+    schedule = DueSchedule.from_settings()
+    started, slowest_batch = time.monotonic(), 0.0
+    try:
+        while True:
+            windows = checkpoint.windows
+            batch_started = time.monotonic()
+            for batch in _due_batches(checkpoint, schedule, is_testing_mode):
+                city_subscriptions = defaultdict(list)
+                for subscription_id, city, _ in batch:
+                    city_subscriptions[city].append(subscription_id)
+                logger.info(f'Found {len(batch)} due subscriptions for {len(city_subscriptions)} unique cities.')
+                fetch_weather_and_dispatch.delay(city_subscriptions, checkpoint.readings_id)
+                if not checkpoint.advance(windows, batch[-1][2], len(batch)):
+                    return f'Task complete: Run {checkpoint.run_id} already finished.'
+                _report_progress(self, checkpoint)
+
+                # Stop while there is still time for another batch as slow as the slowest so far.
+                slowest_batch = max(slowest_batch, time.monotonic() - batch_started)
+                if time.monotonic() - started + slowest_batch > settings.PLANNER_RUN_BUDGET:
+                    return _continue_later(self, checkpoint)
+                batch_started = time.monotonic()
+            # A tick that added a window mid-run makes `finish` refuse, so go round again.
+            if checkpoint.finish(windows):
+                break
+    except SoftTimeLimitExceeded:
+        return _continue_later(self, checkpoint)
+
+    if not checkpoint.planned:
         logger.info('No subscriptions are due for notification at this time.')
         return 'Task complete: No due subscriptions.'
 
-    logger.info(f'Found {len(due_subscriptions)} due subscriptions for {len(cities_to_fetch)} unique cities.')
+    final_message = f'Task complete: Planned {checkpoint.planned} due subscriptions.'
+    logger.info(final_message)
+    return final_message
 
-    weather_client = WeatherClient()
-    weather_data_map = {}
+@shared_task
+def fetch_weather_and_dispatch(city_subscriptions: dict, run_id: str = None):
+    """Fetches weather once per city and enqueues the deliveries.
+    `city_subscriptions` maps each city to the ids of its due subscriptions.
+    Readings are published to Redis under a run id that the deliveries carry;
+    cities an earlier batch of the same run published within
+    WEATHER_READING_REUSE_WINDOW are not fetched again
+    """
+    from .services.weather_client import WeatherClient
+
+    run_id = run_id or uuid.uuid4().hex
+    weather_data_map = WeatherReadings(run_id).load(city_subscriptions, max_age=settings.WEATHER_READING_REUSE_WINDOW)
+    cities_to_fetch = Counter({
+        city: len(ids) for city, ids in city_subscriptions.items() if city not in weather_data_map
+    })
+    if cities_to_fetch:
+        weather_client = WeatherClient(quota=WeatherQuota.from_settings(), defer_throttled=True)
+        logger.info(f'Fetching weather for cities: {list(cities_to_fetch)}')
+        fetched, deferred = _fetch_weather(weather_client, cities_to_fetch)
+        weather_data_map.update(fetched)
+        if deferred:
+            # Over the per-minute budget: these cities go out once it allows, not a period later.
+            countdown = max(deferred.values())
+            logger.info(f'Weather quota reached; fetching {list(deferred)} again in {countdown:.0f}s.')
+            fetch_weather_and_dispatch.apply_async(
+                ({city: city_subscriptions.pop(city) for city in deferred}, run_id), countdown=countdown,
+            )
 
-    logger.info(f'Fetching weather for cities: {list(cities_to_fetch)}')
-    for city in cities_to_fetch:
-        weather_data_map[city] = weather_client.get_weather(city)
+    # Subscriptions handled without a notification wait for their next period.
+    skipped = []
+    for city, ids in city_subscriptions.items():
+        if not weather_data_map.get(city):
+            logger.warning(f"Skipping distribution for '{city}' (IDs: {ids}): No weather data was fetched.")
+            skipped.extend(ids)
 
-    notifications_sent = 0
-    for sub in due_subscriptions:
+    # One fingerprint per city; each subscription compares against its stored copy.
+    fingerprints = {
+        city: weather_fingerprint(weather_data)
+        for city, weather_data in weather_data_map.items() if weather_data
+    }
+    WeatherReadings(run_id).publish({
+        city: weather_data_map[city] for city in fingerprints if city in cities_to_fetch
+    })
+
+    subscriptions = Subscription.objects.filter(
+        id__in=[pk for city, ids in city_subscriptions.items() if city in fingerprints for pk in ids],
+        is_active=True,
+    ).select_related('user')
+
+    dispatched = 0
+    unchanged = 0
+    digests = defaultdict(list)
+    for sub in subscriptions:
         weather_data = weather_data_map.get(sub.city)
+        if not weather_data:
+            continue
 
-        if weather_data:
-            logger.info(f"Distributing notification for '{sub.city}' (ID: {sub.id})")
-            if sub.notification_method == Subscription.NotificationMethod.EMAIL:
-                send_weather_email(sub, weather_data)
-            elif sub.notification_method == Subscription.NotificationMethod.WEBHOOK:
-                send_weather_webhook(sub, weather_data)
+        if sub.notify_on_change and not has_significant_change(sub.last_sent_fingerprint, fingerprints[sub.city]):
+            logger.info(f"Skipping '{sub.city}' (ID: {sub.id}): weather unchanged since last notification.")
+            skipped.append(sub.id)
+            unchanged += 1
+            continue
 
-            sub.last_notified_at = now
-            sub.save(update_fields=['last_notified_at'])
-            notifications_sent += 1
-        else:
-            logger.warning(f"Skipping distribution for '{sub.city}' (ID: {sub.id}): No weather data was fetched.")
+        logger.info(f"Distributing notification for '{sub.city}' (ID: {sub.id})")
+        if sub.notification_method == Subscription.NotificationMethod.EMAIL:
+            if sub.user.email_digest:
+                # Digest subscribers get one email per run, dispatched below.
+                digests[sub.user_id].append(sub)
+            else:
+                deliver_email.delay(sub.id, run_id)
+        elif sub.notification_method == Subscription.NotificationMethod.WEBHOOK:
+            deliver_webhook.delay(sub.id, run_id)
+        dispatched += 1
 
-    final_message = (f'Task complete: Processed {len(due_subscriptions)} due subscriptions. '
-                     f'Sent {notifications_sent} notifications.')
+    for entries in digests.values():
+        deliver_email_digest.delay([sub.id for sub in entries], run_id)
+    _mark_checked(skipped)
+
+    final_message = (f'Task complete: Dispatched {dispatched} notifications. '
+                     f'Skipped {unchanged} unchanged.')
     logger.info(final_message)
-    return final_message
\ No newline at end of file
+    return final_message
+
+def _mark_checked(subscription_ids):
+    """Records subscriptions handled without a notification (unchanged, no
+    weather, dead-lettered), so they wait for their next period instead of
+    being due again on every run
+    """
+    if not subscription_ids:
+        return
+    checked = Subscription.objects.filter(id__in=subscription_ids)
+    checked.update(last_checked_at=timezone.now())
+    # update() sends no signals, so move the subscriptions along the due schedule here.
+    schedule_subscriptions(checked.only(*SCHEDULE_FIELDS))
+
+def _mark_notified(subscription_ids, weather_data: dict):
+    notified = Subscription.objects.filter(id__in=subscription_ids)
+    now = timezone.now()
+    notified.update(
+        last_notified_at=now,
+        last_checked_at=now,
+        last_sent_fingerprint=weather_fingerprint(weather_data),
+    )
+    # update() sends no signals, so move the subscriptions along the due schedule here.
+    schedule_subscriptions(notified.only(*SCHEDULE_FIELDS))
+
+def _retry_or_dead_letter(task, error: DeliveryError, *args, subscription_ids: list):
+    """Schedules another attempt with exponential backoff and full jitter, or
+    records the delivery in the dead-letter store once DELIVERY_MAX_RETRIES is
+    used up. The subscriptions stay un-notified either way, so nothing is lost;
+    dead-lettered ones move on to their next period
+    """
+    attempts = task.request.retries + 1
+    if task.request.retries < settings.DELIVERY_MAX_RETRIES:
+        countdown = get_exponential_backoff_interval(
+            factor=settings.DELIVERY_RETRY_BACKOFF,
+            retries=task.request.retries,
+            maximum=settings.DELIVERY_RETRY_BACKOFF_MAX,
+            full_jitter=True,
+        )
+        logger.warning(f'{task.name} attempt {attempts} failed, retrying in {countdown}s: {error}')
+        raise task.retry(exc=error, countdown=countdown, max_retries=settings.DELIVERY_MAX_RETRIES)
+
+    FailedDelivery.objects.create(task_name=task.name, args=list(args), attempts=attempts, error=str(error))
+    _mark_checked(subscription_ids)
+    logger.error(f'{task.name} gave up after {attempts} attempts: {error}')
+    return f'Dead-lettered after {attempts} attempts.'
+
+def _load_readings(run_id: str, cities) -> dict:
+    """Returns city -> reading published by the run, fetching live any that
+    expired (e.g. when a dead-lettered delivery is replayed days later)
+    """
+    cities = set(cities)
+    readings = WeatherReadings(run_id).load(cities)
+    missing = cities - readings.keys()
+    if missing:
+        from .services.weather_client import WeatherClient
+        weather_client = WeatherClient(quota=WeatherQuota.from_settings())
+        for city in missing:
+            weather_data = weather_client.get_weather(city)
+            if weather_data:
+                readings[city] = weather_data
+    return readings
+
+@shared_task(bind=True)
+def deliver_email(self, subscription_id: int, run_id: str):
+    """Sends one weather email and records the delivered reading"""
+    from .services.email_sender import send_weather_email
+
+    sub = Subscription.objects.select_related('user').filter(id=subscription_id).first()
+    if sub is None:
+        return f'Skipped: subscription {subscription_id} no longer exists.'
+    weather_data = _load_readings(run_id, [sub.city]).get(sub.city)
+    if not weather_data:
+        return f'Skipped: no weather reading for {sub.city}.'
+
+    release_db_connection()
+    try:
+        send_weather_email(sub, weather_data)
+    except DeliveryError as error:
+        return _retry_or_dead_letter(self, error, subscription_id, run_id, subscription_ids=[subscription_id])
+    _mark_notified([sub.id], weather_data)
+
+@shared_task(bind=True)
+def deliver_email_digest(self, subscription_ids: list, run_id: str):
+    """Sends one email covering all of a user's due cities"""
+    from .services.email_sender import send_weather_digest_email
+
+    subscriptions = list(Subscription.objects.select_related('user').filter(id__in=subscription_ids))
+    weather_by_city = _load_readings(run_id, [sub.city for sub in subscriptions])
+    entries = [(sub, weather_by_city[sub.city]) for sub in subscriptions if sub.city in weather_by_city]
+    if not entries:
+        return 'Skipped: no subscriptions left to notify.'
+
+    release_db_connection()
+    try:
+        send_weather_digest_email(entries[0][0].user.email, entries)
+    except DeliveryError as error:
+        return _retry_or_dead_letter(self, error, subscription_ids, run_id, subscription_ids=subscription_ids)
+    for city, weather_data in weather_by_city.items():
+        _mark_notified([sub.id for sub, _ in entries if sub.city == city], weather_data)
+
+@shared_task(bind=True)
+def deliver_webhook(self, subscription_id: int, run_id: str):
+    """Posts one weather webhook and records the delivered reading"""
+    from .services.webhook_sender import send_weather_webhook
+
+    sub = Subscription.objects.select_related('user').filter(id=subscription_id).first()
+    if sub is None:
+        return f'Skipped: subscription {subscription_id} no longer exists.'
+    weather_data = _load_readings(run_id, [sub.city]).get(sub.city)
+    if not weather_data:
+        return f'Skipped: no weather reading for {sub.city}.'
+
+    release_db_connection()
+    try:
+        send_weather_webhook(sub, weather_data)
+    except DeliveryError as error:
+        return _retry_or_dead_letter(self, error, subscription_id, run_id, subscription_ids=[subscription_id])
+    _mark_notified([sub.id], weather_data)
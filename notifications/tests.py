@@ -0,0 +1,915 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+import fakeredis
+import pytest
+import requests
+from datetime import datetime, timedelta, timezone as dt_timezone
+from celery.exceptions import SoftTimeLimitExceeded
+from django.core.management import call_command
+from django.template.loader import render_to_string
+from django.db import connections
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+from subscriptions.models import City, Subscription
+from users.models import User
+from .services.providers import (
+    FakeWeatherProvider,
+    OpenMeteoProvider,
+    QuotaExceeded,
+    WeatherProvider,
+    WeatherProviderError,
+)
+from .models import FailedDelivery
+from .services import email_template
+from .services.checkpoint import PlannerCheckpoint
+from .services.email_sender import build_weather_report
+from .services.http_pool import get_http_session, release_db_connection
+from .services.quota import WeatherQuota
+from .services.readings import WeatherReadings
+from .services.weather_client import WeatherClient
+from project.celery import app as celery_app, recycle_db_connections
+from .tasks import (
+    _due_batches,
+    _due_filter,
+    _report_progress,
+    deliver_webhook,
+    fetch_weather_and_dispatch,
+    process_and_send_notifications,
+)
+
+
+WEATHER = {
+    'main': {'temp': 12.3, 'feels_like': 10.1, 'humidity': 70},
+    'weather': [{'description': 'light rain'}],
+    'wind': {'speed': 4.2},
+}
+
+@pytest.fixture
+def testing_schedule(settings):
+    """A fixture that makes every subscription due on each run"""
+    settings.SUBSCRIPTION_TESTING_SCHEDULE = True
+
+@pytest.fixture
+def weather_client():
+    """A fixture that replaces the OpenWeatherMap client with a stub"""
+    with patch('notifications.services.weather_client.WeatherClient') as client_class:
+        client_class.return_value.get_weather.return_value = WEATHER
+        yield client_class.return_value
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+class TestEmailDigest:
+    """Groups tests for the per-user email digest mode"""
+
+    def _subscribe(self, user, *cities):
+        for city in cities:
+            Subscription.objects.create(
+                user=user, city=city, notification_period=1, notification_method='email'
+            )
+
+    def test_digest_user_receives_single_email(self, weather_client, mailoutbox):
+        """Tests a digest user receiving one message covering all their cities"""
+        user = User.objects.create_user(email='digest@example.com', password='pw', email_digest=True)
+        self._subscribe(user, 'London', 'Paris', 'Rome')
+
+        process_and_send_notifications()
+
+        assert len(mailoutbox) == 1
+        html = mailoutbox[0].alternatives[0][0]
+        for city in ('London', 'Paris', 'Rome'):
+            assert city in html
+        assert Subscription.objects.filter(last_notified_at__isnull=True).count() == 0
+
+    def test_regular_user_receives_email_per_city(self, weather_client, mailoutbox):
+        """Tests a user without digest mode still receiving one email per subscription"""
+        user = User.objects.create_user(email='plain@example.com', password='pw')
+        self._subscribe(user, 'London', 'Paris')
+
+        process_and_send_notifications()
+
+        assert len(mailoutbox) == 2
+        assert {message.subject for message in mailoutbox} == {
+            'Your Weather Update for London',
+            'Your Weather Update for Paris',
+        }
+
+@pytest.mark.django_db
+class TestDueSubscriptions:
+    """Groups tests for selecting due subscriptions in production mode"""
+
+    def test_due_filter_respects_period_and_last_checked(self):
+        """Tests only subscriptions scheduled this hour and not checked recently being due"""
+        now = datetime(2025, 1, 1, 6, 0, tzinfo=dt_timezone.utc)
+        user = User.objects.create_user(email='due@example.com', password='pw')
+        due = Subscription.objects.create(user=user, city='Kyiv', notification_period=3, notification_method='email')
+        Subscription.objects.create(user=user, city='Rome', notification_period=12, notification_method='email')
+        Subscription.objects.create(
+            user=user, city='Paris', notification_period=1, notification_method='email',
+            last_checked_at=now - timedelta(minutes=30)
+        )
+        Subscription.objects.create(
+            user=user, city='Berlin', notification_period=1, notification_method='email', is_active=False
+        )
+
+        queryset = Subscription.objects.filter(is_active=True).filter(_due_filter(now, is_testing_mode=False))
+
+        assert list(queryset) == [due]
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+def test_aliases_share_one_weather_fetch(weather_client, mailoutbox):
+    """Tests subscriptions entered under different aliases triggering a single fetch"""
+    City.objects.create(name='New York', aliases=['NYC', 'New York City'])
+    for index, city in enumerate(['NYC', 'New York City', 'new york']):
+        user = User.objects.create_user(email=f'ny{index}@example.com', password='pw')
+        Subscription.objects.create(user=user, city=city, notification_period=1, notification_method='email')
+
+    process_and_send_notifications()
+
+    weather_client.get_weather.assert_called_once_with('New York')
+    assert len(mailoutbox) == 3
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+def test_grid_mode_shares_reading_between_nearby_cities(weather_client, mailoutbox, settings):
+    """Tests nearby cities sharing one coordinate fetch and a city alone in its cell using its own"""
+    settings.WEATHER_GRID_PRECISION = 4
+    City.objects.create(name='London', latitude=51.5074, longitude=-0.1278)
+    City.objects.create(name='Camden', latitude=51.5390, longitude=-0.1426)
+    City.objects.create(name='Bristol', latitude=51.4545, longitude=-2.5879)
+    weather_client.get_weather_by_coords.return_value = WEATHER
+    user = User.objects.create_user(email='grid@example.com', password='pw')
+    for city in ('London', 'Camden', 'Bristol', 'Oslo'):
+        Subscription.objects.create(user=user, city=city, notification_period=1, notification_method='email')
+
+    process_and_send_notifications()
+
+    assert weather_client.get_weather_by_coords.call_count == 2
+    weather_client.get_weather_by_coords.assert_any_call(51.4545, -2.5879)
+    weather_client.get_weather.assert_called_once_with('Oslo')
+    assert len(mailoutbox) == 4
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+class TestNotifyOnChange:
+    """Groups tests for the notify-on-change mode"""
+
+    @pytest.fixture
+    def subscription(self):
+        user = User.objects.create_user(email='change@example.com', password='pw')
+        return Subscription.objects.create(
+            user=user, city='Oslo', notification_period=1, notification_method='email', notify_on_change=True
+        )
+
+    def _set_fingerprint(self, subscription, temp, desc):
+        Subscription.objects.filter(pk=subscription.pk).update(
+            last_sent_fingerprint={'temp': temp, 'desc': desc}, last_notified_at=None
+        )
+
+    def test_first_notification_stores_fingerprint(self, subscription, weather_client, mailoutbox):
+        """Tests the first send always going out and recording the reading"""
+        process_and_send_notifications()
+
+        subscription.refresh_from_db()
+        assert len(mailoutbox) == 1
+        assert subscription.last_sent_fingerprint == {'temp': 12.3, 'desc': 'light rain'}
+
+    @pytest.mark.parametrize('temp, desc, expected_emails', [
+        (12.0, 'light rain', 0),
+        (9.0, 'light rain', 1),
+        (12.3, 'clear sky', 1),
+    ])
+    def test_threshold(self, subscription, weather_client, mailoutbox, temp, desc, expected_emails):
+        """Tests small changes being skipped and larger ones being delivered"""
+        self._set_fingerprint(subscription, temp, desc)
+
+        process_and_send_notifications()
+
+        assert len(mailoutbox) == expected_emails
+
+    def test_regular_subscription_ignores_fingerprint(self, subscription, weather_client, mailoutbox):
+        """Tests subscriptions without the mode being notified on every run"""
+        self._set_fingerprint(subscription, 12.3, 'light rain')
+        Subscription.objects.filter(pk=subscription.pk).update(notify_on_change=False)
+
+        process_and_send_notifications()
+
+        assert len(mailoutbox) == 1
+
+@pytest.fixture
+def quota(settings):
+    """A fixture returning a small shared quota backed by an in-memory Redis"""
+    settings.OPENWEATHERMAP_API_KEY = 'test-key'
+    return WeatherQuota(fakeredis.FakeRedis(), daily_limit=3, minute_limit=2)
+
+def _response(status_code, payload=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload or {}).encode()
+    response.headers.update(headers or {})
+    return response
+
+class TestWeatherQuota:
+    """Groups tests for the shared OpenWeatherMap call budget"""
+
+    def test_minute_limit(self, quota):
+        """Tests calls beyond the per-minute allowance being refused"""
+        assert [quota.acquire() for _ in range(3)] == [True, True, False]
+
+    def test_refused_calls_cost_no_budget(self, quota):
+        """Tests calls refused by the per-minute limit leaving the daily budget untouched"""
+        quota.acquire()
+        quota.acquire()
+        remaining = quota.remaining_today()
+
+        assert [quota.acquire() for _ in range(5)] == [False] * 5
+        assert quota.remaining_today() == remaining == 1
+
+    def test_rate_limit_backs_off_and_halves_limit(self, quota):
+        """Tests a 429 pausing calls and reducing the per-minute limit"""
+        quota.record_rate_limited('30')
+
+        assert quota.acquire() is False
+        assert quota.current_minute_limit() == 1
+        assert 0 < quota.redis.ttl('weather:quota:backoff') <= 30
+
+    def test_client_falls_back_to_cached_reading(self, quota):
+        """Tests a 429 response being served from the last cached reading"""
+        client = WeatherClient(quota=quota)
+        with patch('requests.get', return_value=_response(200, WEATHER)):
+            assert client.get_weather('Oslo') == WEATHER
+
+        with patch('requests.get', return_value=_response(429, headers={'Retry-After': '5'})):
+            assert client.get_weather('Oslo') == WEATHER
+
+        with patch('requests.get') as get:
+            assert client.get_weather('Oslo') == WEATHER  # Still backing off
+            get.assert_not_called()
+
+    def test_throttled_lookup_is_deferred_until_daily_budget_is_spent(self, quota):
+        """Tests the minute limit deferring a lookup, and only a spent daily budget using the cache"""
+        client = WeatherClient(quota=quota, defer_throttled=True)
+        with patch('requests.get', return_value=_response(200, WEATHER)):
+            client.get_weather('Oslo')
+            client.get_weather('Rome')
+            with pytest.raises(QuotaExceeded) as refusal:
+                client.get_weather('Oslo')
+            assert 0 < refusal.value.retry_after <= 60
+
+            quota.redis.set(f"weather:quota:day:{time.strftime('%Y%m%d', time.gmtime())}", 3)
+            assert quota.retry_after() is None
+            assert client.get_weather('Oslo') == WEATHER
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+def test_cities_over_minute_limit_are_fetched_later(settings, mailoutbox):
+    """Tests cities refused by the per-minute limit being re-enqueued instead of skipped for a period"""
+    settings.OPENWEATHERMAP_API_KEY = 'test-key'
+    settings.OPENWEATHERMAP_DAILY_QUOTA = 100
+    settings.OPENWEATHERMAP_CALLS_PER_MINUTE = 2
+    city_subscriptions = defaultdict(list)
+    for index, city in enumerate(['Oslo', 'Oslo', 'Rome', 'Rome', 'Kyiv']):
+        user = User.objects.create_user(email=f'throttled{index}@example.com', password='pw')
+        sub = Subscription.objects.create(user=user, city=city, notification_period=1, notification_method='email')
+        city_subscriptions[city].append(sub.id)
+
+    with patch('requests.get', return_value=_response(200, WEATHER)), \
+            patch('notifications.tasks.fetch_weather_and_dispatch.apply_async') as later:
+        fetch_weather_and_dispatch(dict(city_subscriptions), 'run-1')
+
+    (deferred, run_id), options = later.call_args.args[0], later.call_args.kwargs
+    assert deferred == {'Kyiv': city_subscriptions['Kyiv']} and run_id == 'run-1'
+    assert 0 < options['countdown'] <= 60
+    assert len(mailoutbox) == 4
+    assert Subscription.objects.get(city='Kyiv').last_checked_at is None
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+def test_most_subscribed_cities_fetched_first(weather_client, mailoutbox):
+    """Tests cities being fetched in order of due subscribers"""
+    for index, cities in enumerate([('Rome', 'Oslo'), ('Oslo', 'Kyiv'), ('Oslo', 'Kyiv')]):
+        user = User.objects.create_user(email=f'priority{index}@example.com', password='pw')
+        for city in cities:
+            Subscription.objects.create(user=user, city=city, notification_period=1, notification_method='email')
+
+    process_and_send_notifications()
+
+    fetched = [call.args[0] for call in weather_client.get_weather.call_args_list]
+    assert fetched == ['Oslo', 'Kyiv', 'Rome']
+
+class StubProvider(WeatherProvider):
+    """A provider answering after a delay, or failing"""
+
+    def __init__(self, name, delay=0.0, reading=None):
+        super().__init__()
+        self.name, self.delay, self.reading = name, delay, reading
+        self.calls = 0
+
+    def get_by_city(self, city):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.reading is None:
+            raise WeatherProviderError(f'{self.name} failed')
+        return self.reading
+
+    def get_by_coords(self, latitude, longitude):
+        return self.get_by_city(f'{latitude},{longitude}')
+
+class TestWeatherProviders:
+    """Groups tests for the pluggable providers and hedged requests"""
+
+    def test_provider_must_implement_both_lookups(self):
+        """Tests a provider missing a lookup failing when built rather than when called"""
+        class CityOnlyProvider(WeatherProvider):
+            def get_by_city(self, city):
+                return WEATHER
+
+        with pytest.raises(TypeError):
+            CityOnlyProvider()
+
+    def test_fake_provider_is_deterministic(self):
+        """Tests the fake provider returning stable readings in the expected shape"""
+        provider = FakeWeatherProvider()
+
+        assert provider.get_by_city('Oslo') == provider.get_by_city('oslo')
+        assert set(provider.get_by_city('Oslo')) == {'main', 'weather', 'wind'}
+
+    def test_open_meteo_reading_is_normalized(self):
+        """Tests Open-Meteo responses being mapped to the shape the senders use"""
+        geocoding = _response(200, {'results': [{'latitude': 59.91, 'longitude': 10.75}]})
+        forecast = _response(200, {'current': {
+            'temperature_2m': 4.5, 'apparent_temperature': 1.2, 'relative_humidity_2m': 81,
+            'wind_speed_10m': 3.4, 'weather_code': 61,
+        }})
+        with patch('requests.get', side_effect=[geocoding, forecast]):
+            reading = OpenMeteoProvider().get_by_city('Oslo')
+
+        assert reading['main'] == {'temp': 4.5, 'feels_like': 1.2, 'humidity': 81}
+        assert reading['weather'][0]['description'] == 'light rain'
+        assert reading['wind']['speed'] == 3.4
+
+    def test_failover_to_next_provider(self):
+        """Tests the next provider being used when the primary fails"""
+        client = WeatherClient(providers=[StubProvider('broken'), StubProvider('backup', reading=WEATHER)])
+
+        assert client.get_weather('Oslo') == WEATHER
+
+    def test_hedged_request_takes_first_answer(self, settings):
+        """Tests a slow primary being overtaken by the hedged secondary"""
+        settings.WEATHER_HEDGING = True
+        settings.WEATHER_HEDGE_DELAY = 0.05
+        slow = StubProvider('slow', delay=1.0, reading={'from': 'slow'})
+        fast = StubProvider('fast', delay=0.0, reading=WEATHER)
+        client = WeatherClient(providers=[slow, fast])
+
+        started = time.monotonic()
+        assert client.get_weather('Oslo') == WEATHER
+        assert time.monotonic() - started < 0.5
+
+    def test_hedge_not_fired_for_fast_primary(self, settings):
+        """Tests the secondary staying idle when the primary answers in time"""
+        settings.WEATHER_HEDGING = True
+        settings.WEATHER_HEDGE_DELAY = 0.5
+        primary = StubProvider('primary', reading=WEATHER)
+        secondary = StubProvider('secondary', reading={'from': 'secondary'})
+
+        assert WeatherClient(providers=[primary, secondary]).get_weather('Oslo') == WEATHER
+        assert secondary.calls == 0
+
+class TestTaskRouting:
+    """Groups tests for the per-stage Celery queues"""
+
+    @pytest.mark.parametrize('task, queue', [
+        ('process_and_send_notifications', 'planner'),
+        ('fetch_weather_and_dispatch', 'weather'),
+        ('deliver_email', 'email'),
+        ('deliver_email_digest', 'email'),
+        ('deliver_webhook', 'webhook'),
+    ])
+    def test_task_routed_to_its_queue(self, task, queue):
+        """Tests each notification stage being sent to its dedicated queue"""
+        route = celery_app.amqp.router.route({}, f'notifications.tasks.{task}')
+
+        assert route['queue'].name == queue
+
+    @pytest.mark.django_db
+    @pytest.mark.usefixtures('testing_schedule')
+    def test_planner_enqueues_one_weather_fetch(self):
+        """Tests the planner handing all due subscriptions to a single weather task"""
+        for index, city in enumerate(['Oslo', 'Oslo', 'Rome']):
+            user = User.objects.create_user(email=f'planner{index}@example.com', password='pw')
+            Subscription.objects.create(user=user, city=city, notification_period=1, notification_method='email')
+
+        with patch('notifications.tasks.fetch_weather_and_dispatch.delay') as delay:
+            process_and_send_notifications()
+
+        delay.assert_called_once()
+        assert {city: len(ids) for city, ids in delay.call_args.args[0].items()} == {'Oslo': 2, 'Rome': 1}
+
+@pytest.mark.django_db
+class TestGreenDelivery:
+    """Groups tests for running delivery tasks on a gevent or eventlet pool"""
+
+    def test_webhook_uses_pooled_session(self):
+        """Tests webhooks going through the shared keep-alive session"""
+        user = User.objects.create_user(email='hook@example.com', password='pw')
+        sub = Subscription.objects.create(
+            user=user, city='Oslo', notification_period=1,
+            notification_method='webhook', webhook_url='https://example.com/hook',
+        )
+
+        WeatherReadings('run-1').publish({'Oslo': WEATHER})
+
+        with patch.object(get_http_session(), 'post', return_value=_response(204)) as post:
+            deliver_webhook(sub.id, 'run-1')
+
+        post.assert_called_once()
+        assert get_http_session() is get_http_session()
+        sub.refresh_from_db()
+        assert sub.last_notified_at is not None
+
+    @pytest.mark.parametrize('green, closed', [(True, True), (False, False)])
+    def test_connection_released_only_on_green_pool(self, green, closed):
+        """Tests greenlets giving back their database connection before network I/O"""
+        with patch('notifications.services.http_pool.in_green_pool', return_value=green), \
+                patch('notifications.services.http_pool.connection') as connection:
+            release_db_connection()
+
+        assert connection.close.called is closed
+
+@pytest.mark.django_db
+class TestDeliveryRetries:
+    """Groups tests for retrying failed deliveries and the dead-letter store"""
+
+    @pytest.fixture(autouse=True)
+    def eager_retries(self, monkeypatch):
+        # Eager tasks only replay their retries when exceptions aren't propagated.
+        monkeypatch.setattr(celery_app.conf, 'task_eager_propagates', False)
+
+    @pytest.fixture
+    def subscription(self, settings):
+        settings.DELIVERY_MAX_RETRIES = 2
+        WeatherReadings('run-1').publish({'Oslo': WEATHER})
+        user = User.objects.create_user(email='retry@example.com', password='pw')
+        return Subscription.objects.create(
+            user=user, city='Oslo', notification_period=1,
+            notification_method='webhook', webhook_url='https://example.com/hook',
+        )
+
+    def test_retry_succeeds_after_transient_failure(self, subscription):
+        """Tests a delivery going through on a later attempt"""
+        responses = [_response(503), _response(204)]
+        with patch.object(get_http_session(), 'post', side_effect=responses) as post:
+            deliver_webhook.delay(subscription.id, 'run-1')
+
+        subscription.refresh_from_db()
+        assert post.call_count == 2
+        assert subscription.last_notified_at is not None
+        assert not FailedDelivery.objects.exists()
+
+    def test_exhausted_retries_are_dead_lettered(self, subscription):
+        """Tests a delivery failing every attempt being stored and left un-notified"""
+        with patch.object(get_http_session(), 'post', return_value=_response(500)) as post:
+            deliver_webhook.delay(subscription.id, 'run-1')
+
+        subscription.refresh_from_db()
+        failed = FailedDelivery.objects.get()
+        assert post.call_count == 3
+        assert subscription.last_notified_at is None
+        assert subscription.last_checked_at is not None
+        assert failed.task_name == 'notifications.tasks.deliver_webhook'
+        assert failed.args == [subscription.id, 'run-1']
+        assert failed.attempts == 3
+
+    def test_replay_command_redelivers(self, subscription, weather_client):
+        """Tests replaying dead-lettered deliveries, refetching their expired reading"""
+        FailedDelivery.objects.create(
+            task_name='notifications.tasks.deliver_webhook', args=[subscription.id, 'expired-run'], attempts=3
+        )
+
+        with patch.object(get_http_session(), 'post', return_value=_response(204)):
+            call_command('replay_failed_deliveries', '--task', 'deliver_webhook', stdout=io.StringIO())
+
+        subscription.refresh_from_db()
+        weather_client.get_weather.assert_called_once_with('Oslo')
+        assert subscription.last_notified_at is not None
+        assert FailedDelivery.objects.get().replayed_at is not None
+
+class TestPublishedReadings:
+    """Groups tests for sharing a run's readings through Redis"""
+
+    def test_round_trip_with_expiry(self, fake_redis, settings):
+        """Tests readings being stored with a TTL and read back by city"""
+        settings.WEATHER_READING_TTL = 60
+        readings = WeatherReadings('run-1')
+        readings.publish({'Oslo': WEATHER, 'Rome': {'main': {'temp': 20}}})
+
+        assert readings.load(['Oslo', 'Kyiv']) == {'Oslo': WEATHER}
+        assert 0 < fake_redis.ttl('weather:reading:run-1:oslo') <= 60
+
+    def test_reuse_is_limited_to_fresh_readings(self, fake_redis, settings):
+        """Tests readings older than the reuse window being left out of reuse but kept for deliveries"""
+        readings = WeatherReadings('run-1')
+        readings.publish({'Oslo': WEATHER, 'Rome': WEATHER})
+        fake_redis.expire('weather:reading:run-1:oslo', settings.WEATHER_READING_TTL - 601)
+
+        assert readings.load(['Oslo', 'Rome'], max_age=600) == {'Rome': WEATHER}
+        assert readings.load(['Oslo', 'Rome']) == {'Oslo': WEATHER, 'Rome': WEATHER}
+
+    @pytest.mark.django_db
+    @pytest.mark.usefixtures('testing_schedule')
+    def test_delivery_tasks_carry_no_payload(self, weather_client):
+        """Tests deliveries being enqueued with a run id rather than the reading"""
+        user = User.objects.create_user(email='payload@example.com', password='pw')
+        sub = Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+
+        with patch('notifications.tasks.deliver_email.delay') as delay:
+            process_and_send_notifications()
+
+        subscription_id, run_id = delay.call_args.args
+        assert subscription_id == sub.id
+        assert WeatherReadings(run_id).load(['Oslo']) == {'Oslo': WEATHER}
+
+def test_tasks_module_imports_no_http_stack():
+    """Tests the task module leaving requests and the senders to be loaded on first use"""
+    code = (
+        'import django, sys; django.setup(); import notifications.tasks; '
+        'print(sorted(name for name in ("requests", "notifications.services.webhook_sender") if name in sys.modules))'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'project.settings'},
+    )
+
+    assert result.stdout.strip() == '[]'
+
+@pytest.mark.parametrize('is_eager, recycled', [(False, True), (True, False)])
+def test_worker_tasks_recycle_db_connections(is_eager, recycled):
+    """Tests worker tasks keeping healthy connections the way requests do"""
+    task = SimpleNamespace(request=SimpleNamespace(is_eager=is_eager))
+    with patch('django.db.close_old_connections') as close_old:
+        recycle_db_connections(task=task)
+
+    assert close_old.called is recycled
+
+@pytest.mark.parametrize('green, pooled, closed', [(True, False, True), (True, True, False), (False, False, False)])
+def test_green_workers_close_unpooled_connections(green, pooled, closed):
+    """Tests green pool tasks closing their connection unless DATABASE_POOL_MAX_SIZE caps them"""
+    task = SimpleNamespace(request=SimpleNamespace(is_eager=False))
+    options = {'pool': {'max_size': 4}} if pooled else {}
+    with patch('notifications.services.http_pool.in_green_pool', return_value=green), \
+            patch.dict(connections['default'].settings_dict, {'OPTIONS': options}), \
+            patch.object(type(connections['default']), 'close') as close, \
+            patch('django.db.close_old_connections') as close_old:
+        recycle_db_connections(task=task)
+
+    assert close.called is closed
+    assert close_old.called is not closed
+
+def test_thread_workers_close_unpooled_connections():
+    """Tests thread pool tasks closing their connection when no pool is configured"""
+    task = SimpleNamespace(request=SimpleNamespace(is_eager=False))
+    with patch.object(type(connections['default']), 'close') as close, patch('django.db.close_old_connections') as close_old:
+        worker = threading.Thread(target=recycle_db_connections, kwargs={'task': task})
+        worker.start()
+        worker.join()
+
+    assert close.called
+    assert not close_old.called
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+class TestPlannerDueSchedule:
+    """Groups tests for planning runs from the Redis due schedule"""
+
+    @pytest.fixture(autouse=True)
+    def enabled(self, settings):
+        settings.SUBSCRIPTION_DUE_SCHEDULE = True
+
+    def test_run_moves_notified_subscriptions_forward(self, weather_client, mailoutbox, fake_redis):
+        """Tests notified subscriptions leaving the due range until their next slot"""
+        user = User.objects.create_user(email='schedule@example.com', password='pw')
+        sub = Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+
+        process_and_send_notifications()
+        process_and_send_notifications()
+
+        sub.refresh_from_db()
+        assert len(mailoutbox) == 1
+        assert fake_redis.zscore('subscriptions:due', sub.id) == (sub.last_checked_at + timedelta(minutes=14)).timestamp()
+
+    def test_unchanged_subscription_waits_for_next_slot(self, weather_client, mailoutbox, fake_redis):
+        """Tests a subscription skipped as unchanged moving forward instead of being re-evaluated every run"""
+        user = User.objects.create_user(email='unchanged@example.com', password='pw')
+        sub = Subscription.objects.create(
+            user=user, city='Oslo', notification_period=1, notification_method='email', notify_on_change=True
+        )
+        Subscription.objects.filter(pk=sub.pk).update(last_sent_fingerprint={'temp': 12.3, 'desc': 'light rain'})
+
+        process_and_send_notifications()
+        process_and_send_notifications()
+
+        sub.refresh_from_db()
+        assert len(mailoutbox) == 0
+        assert weather_client.get_weather.call_count == 1
+        assert sub.last_notified_at is None
+        assert fake_redis.zscore('subscriptions:due', sub.id) == (sub.last_checked_at + timedelta(minutes=14)).timestamp()
+
+    def test_city_without_weather_waits_for_next_slot(self, weather_client, mailoutbox, fake_redis):
+        """Tests a subscription whose weather could not be fetched moving forward instead of staying due"""
+        weather_client.get_weather.return_value = None
+        user = User.objects.create_user(email='noweather@example.com', password='pw')
+        sub = Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+
+        process_and_send_notifications()
+        process_and_send_notifications()
+
+        sub.refresh_from_db()
+        assert weather_client.get_weather.call_count == 1
+        assert fake_redis.zscore('subscriptions:due', sub.id) == (sub.last_checked_at + timedelta(minutes=14)).timestamp()
+
+    def test_stale_candidates_are_pruned(self, weather_client, mailoutbox, fake_redis):
+        """Tests rows deactivated without signals being dropped instead of notified"""
+        user = User.objects.create_user(email='stale@example.com', password='pw')
+        for city in ('Oslo', 'Rome'):
+            Subscription.objects.create(user=user, city=city, notification_period=1, notification_method='email')
+        Subscription.objects.filter(city='Rome').update(is_active=False)
+
+        process_and_send_notifications()
+
+        assert [message.subject for message in mailoutbox] == ['Your Weather Update for Oslo']
+        assert fake_redis.zcard('subscriptions:due') == 1
+
+    def test_missing_schedule_is_rebuilt(self, weather_client, mailoutbox, fake_redis):
+        """Tests the first run after enabling the schedule building it from the table"""
+        user = User.objects.create_user(email='rebuild@example.com', password='pw')
+        Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+        fake_redis.delete('subscriptions:due')
+
+        process_and_send_notifications()
+
+        assert len(mailoutbox) == 1
+
+
+class TestCompiledEmailTemplate:
+    """Groups tests for the precompiled email template artifact"""
+
+    @pytest.fixture(autouse=True)
+    def resolve_per_test(self):
+        email_template.email_template_name.cache_clear()
+        yield
+        email_template.email_template_name.cache_clear()
+
+    def test_inlines_css_and_strips_whitespace(self):
+        """Tests rules being inlined by specificity, browser-only rules kept and template tags untouched"""
+        source = """
+            <style>
+                .box td { color: red; }
+                td:first-child { color: blue; font-weight: bold; }
+                a:hover { color: green; }
+            </style>
+            <table class="box">
+                <tr>
+                    <td>{{ label }}</td>
+                    <td style="color: black">{% if a %}<a href="{% url "home" %}?q={{ q|default:"a&b" }}">x</a>{% endif %}</td>
+                </tr>
+            </table>
+        """
+
+        compiled = email_template.compile_email_html(source)
+
+        assert compiled == (
+            '<style>a:hover{color:green}</style><table><tr>'
+            '<td style="color:blue;font-weight:bold">{{ label }}</td>'
+            '<td style="color:black">{% if a %}<a href="{% url "home" %}?q={{ q|default:"a&b" }}">x</a>{% endif %}</td>'
+            '</tr></table>'
+        )
+
+    def test_rules_inside_loops_stay_in_stylesheet(self):
+        """Tests rules for repeated elements being kept once in <style> with their classes"""
+        source = """
+            <style>
+                .title { color: navy; }
+                .row td { padding: 4px; }
+            </style>
+            <h1 class="title">{{ heading }}</h1>
+            {% for item in items %}
+            <table class="row"><tr><td>{{ item }}</td></tr></table>
+            {% endfor %}
+        """
+
+        compiled = email_template.compile_email_html(source)
+
+        assert compiled == (
+            '<style>.row td{padding:4px}</style><h1 style="color:navy">{{ heading }}</h1>'
+            '{% for item in items %}<table class="row"><tr><td>{{ item }}</td></tr></table>{% endfor %}'
+        )
+
+    @pytest.mark.parametrize('cities', [['Oslo'], ['Oslo', 'Rome', 'Kyiv', 'Lima', 'Pune']])
+    def test_artifact_renders_smaller_than_source(self, cities):
+        """Tests single-city and digest emails both rendering smaller from the artifact"""
+        context = {'reports': [build_weather_report(city, WEATHER) for city in cities]}
+        if len(cities) == 1:
+            context['city'] = cities[0]
+
+        source = render_to_string(email_template.SOURCE_TEMPLATE, context)
+        compiled = render_to_string(email_template.email_template_name(), context)
+
+        assert compiled != source
+        assert len(compiled.encode()) < len(source.encode())
+
+    def test_committed_artifact_is_current(self):
+        """Tests the artifact in the tree matching the source template"""
+        call_command('compile_email_templates', '--check', stdout=io.StringIO())
+
+    @pytest.mark.django_db
+    @pytest.mark.usefixtures('testing_schedule')
+    def test_emails_are_rendered_from_artifact(self, weather_client, mailoutbox):
+        """Tests sent emails carrying inline styles and no stylesheet"""
+        user = User.objects.create_user(email='inline@example.com', password='pw')
+        Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+
+        process_and_send_notifications()
+
+        html = mailoutbox[0].alternatives[0][0]
+        assert '<h1 style="font-size:24px;' in html
+        assert '<table class="weather-info"><tr><td>Temperature:</td>' in html
+        assert 'Weather Update for Oslo' in html and '12.3 °C' in html
+
+    def test_stale_artifact_falls_back_to_source(self, monkeypatch):
+        """Tests the source template being used when the artifact predates it"""
+        monkeypatch.setattr(email_template, 'read_manifest', lambda: {
+            email_template.SOURCE_TEMPLATE: {'name': 'notifications/compiled/old.html', 'source_sha256': 'old'},
+        })
+
+        assert email_template.email_template_name() == email_template.SOURCE_TEMPLATE
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('testing_schedule')
+class TestPlannerCheckpoints:
+    """Groups tests for time-bounded planner runs that checkpoint and resume"""
+
+    @pytest.fixture
+    def subscriptions(self):
+        subscriptions = []
+        for index, city in enumerate(['Oslo', 'Rome', 'Kyiv', 'Lima', 'Pune']):
+            user = User.objects.create_user(email=f'checkpoint{index}@example.com', password='pw')
+            subscriptions.append(Subscription.objects.create(
+                user=user, city=city, notification_period=1, notification_method='email'
+            ))
+        return subscriptions
+
+    def _planned(self, delay):
+        return sorted(pk for call in delay.call_args_list for ids in call.args[0].values() for pk in ids)
+
+    def test_spent_budget_continues_in_a_new_task(self, subscriptions, settings):
+        """Tests a run out of budget re-enqueueing itself until every batch is planned once"""
+        settings.PLANNER_BATCH_SIZE = 2
+        settings.PLANNER_RUN_BUDGET = 0
+
+        with patch('notifications.tasks.fetch_weather_and_dispatch.delay') as delay:
+            result = process_and_send_notifications()
+
+        assert result.startswith('Task paused: Planned 2 due subscriptions so far')
+        assert delay.call_count == 3
+        assert self._planned(delay) == [sub.id for sub in subscriptions]
+        assert PlannerCheckpoint.load() is None
+
+    def test_batches_of_a_run_share_readings(self, weather_client, mailoutbox, settings):
+        """Tests each city being fetched once per run however many batches it spans"""
+        settings.PLANNER_BATCH_SIZE = 1
+        for index in range(3):
+            user = User.objects.create_user(email=f'shared{index}@example.com', password='pw')
+            Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+
+        process_and_send_notifications()
+
+        weather_client.get_weather.assert_called_once_with('Oslo')
+        assert len(mailoutbox) == 3
+
+    def test_later_batches_refetch_stale_readings(self, weather_client, mailoutbox, fake_redis, settings):
+        """Tests a batch fetching again when the run's reading is older than the reuse window"""
+        user = User.objects.create_user(email='stale-reading@example.com', password='pw')
+        sub = Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+        WeatherReadings('run-1').publish({'Oslo': {'main': {'temp': -40}}})
+        age = settings.WEATHER_READING_REUSE_WINDOW + 1
+        fake_redis.expire('weather:reading:run-1:oslo', settings.WEATHER_READING_TTL - age)
+
+        fetch_weather_and_dispatch({'Oslo': [sub.id]}, 'run-1')
+
+        weather_client.get_weather.assert_called_once_with('Oslo')
+        assert WeatherReadings('run-1').load(['Oslo']) == {'Oslo': WEATHER}
+        assert len(mailoutbox) == 1
+
+    def test_batches_never_split_a_digest(self, weather_client, mailoutbox, settings):
+        """Tests a digest user's cities staying in one batch when it exceeds the batch size"""
+        settings.PLANNER_BATCH_SIZE = 2
+        digest = User.objects.create_user(email='wide@example.com', password='pw', email_digest=True)
+        for city in ('Oslo', 'Rome', 'Kyiv'):
+            Subscription.objects.create(user=digest, city=city, notification_period=1, notification_method='email')
+        other = User.objects.create_user(email='next@example.com', password='pw')
+        Subscription.objects.create(user=other, city='Lima', notification_period=1, notification_method='email')
+
+        with patch('notifications.tasks.fetch_weather_and_dispatch.delay', wraps=fetch_weather_and_dispatch.delay) as delay:
+            process_and_send_notifications()
+
+        assert [sorted(call.args[0]) for call in delay.call_args_list] == [['Kyiv', 'Oslo', 'Rome'], ['Lima']]
+        assert sorted(message.to[0] for message in mailoutbox) == ['next@example.com', 'wide@example.com']
+
+    def test_redelivered_task_resumes_after_checkpoint(self, subscriptions):
+        """Tests a run picking up after the last planned subscription instead of starting over"""
+        checkpoint, _ = PlannerCheckpoint.join('run-1', datetime.now(dt_timezone.utc))
+        checkpoint.advance(checkpoint.windows, subscriptions[1].user_id, 2)
+
+        with patch('notifications.tasks.fetch_weather_and_dispatch.delay') as delay:
+            result = process_and_send_notifications(run_id='run-1')
+
+        assert self._planned(delay) == [sub.id for sub in subscriptions[2:]]
+        assert result == 'Task complete: Planned 5 due subscriptions.'
+
+    def test_soft_time_limit_checkpoints_the_run(self, subscriptions, settings):
+        """Tests the soft time limit handing the rest of the run to a continuation"""
+        settings.PLANNER_BATCH_SIZE = 2
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            for index, batch in enumerate(_due_batches(*args)):
+                if len(calls) == 1 and index == 1:
+                    raise SoftTimeLimitExceeded()
+                yield batch
+
+        with patch('notifications.tasks._due_batches', interrupted), \
+                patch('notifications.tasks.fetch_weather_and_dispatch.delay') as delay:
+            result = process_and_send_notifications()
+
+        assert result.startswith('Task paused: Planned 2 due subscriptions so far')
+        assert self._planned(delay) == [sub.id for sub in subscriptions]
+
+    def test_tick_during_a_run_joins_it(self, subscriptions):
+        """Tests a beat tick adding its window to the run in flight rather than planning twice"""
+        PlannerCheckpoint.join('run-1', datetime.now(dt_timezone.utc) - timedelta(hours=1))
+
+        with patch('notifications.tasks.fetch_weather_and_dispatch.delay') as delay:
+            result = process_and_send_notifications()
+            assert result == 'Task complete: Added this window to run run-1 in flight.'
+            assert not delay.called
+
+            process_and_send_notifications(run_id='run-1')
+
+        assert self._planned(delay) == [sub.id for sub in subscriptions]
+        assert PlannerCheckpoint.load() is None
+
+    def test_tick_leaves_the_run_heartbeat_alone(self):
+        """Tests joining a run not counting as progress of the run"""
+        checkpoint, _ = PlannerCheckpoint.join('run-1', datetime.now(dt_timezone.utc) - timedelta(hours=1))
+
+        joined, is_own_run = PlannerCheckpoint.join('run-2', datetime.now(dt_timezone.utc))
+
+        assert not is_own_run
+        assert joined.updated_at == checkpoint.updated_at
+        assert len(joined.windows) == 2
+
+    def test_tick_takes_over_run_with_lost_continuation(self, subscriptions, fake_redis, settings):
+        """Tests a tick resuming a run whose continuation never arrived instead of stalling behind it"""
+        checkpoint, _ = PlannerCheckpoint.join('run-1', datetime.now(dt_timezone.utc) - timedelta(hours=1))
+        checkpoint.advance(checkpoint.windows, subscriptions[1].user_id, 2)
+        stored = json.loads(fake_redis.get(PlannerCheckpoint.KEY))
+        stored['updated_at'] -= 2 * settings.PLANNER_RUN_BUDGET + 1
+        fake_redis.set(PlannerCheckpoint.KEY, json.dumps(stored))
+
+        with patch('notifications.tasks.fetch_weather_and_dispatch.delay') as delay:
+            result = process_and_send_notifications()
+            late = process_and_send_notifications(run_id='run-1')
+
+        # Both windows are planned by the tick, on top of the 2 the stalled task did.
+        assert result == 'Task complete: Planned 7 due subscriptions.'
+        assert self._planned(delay) == [sub.id for sub in subscriptions]
+        assert late == 'Task complete: Run run-1 already finished.'
+        assert PlannerCheckpoint.load() is None
+
+    def test_continuation_of_finished_run_does_nothing(self, subscriptions):
+        """Tests a stray continuation of a completed run planning nothing"""
+        with patch('notifications.tasks.fetch_weather_and_dispatch.delay') as delay:
+            result = process_and_send_notifications(run_id='gone')
+
+        assert result == 'Task complete: Run gone already finished.'
+        assert not delay.called
+
+    def test_progress_is_reported_to_result_backend(self):
+        """Tests worker runs publishing their checkpoint as PROGRESS"""
+        checkpoint = SimpleNamespace(run_id='run-1', planned=10, windows=[['2026-01-01T00:00:00+00:00', 42]])
+        task = SimpleNamespace(request=SimpleNamespace(id='task-1', is_eager=False), update_state=Mock())
+
+        _report_progress(task, checkpoint)
+
+        task.update_state.assert_called_once_with(state='PROGRESS', meta={
+            'run_id': 'run-1', 'planned': 10, 'windows': [['2026-01-01T00:00:00+00:00', 42]],
+        })
@@ -3,6 +3,21 @@ ASGI config for Task_17_Basic_Weather_Reminder project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The subscription and registration API views are async, so production serves
+this module rather than ``project.wsgi``, using gunicorn to manage uvicorn
+worker processes (see the Procfile)::
+
+    gunicorn project.asgi:application -k uvicorn_worker.UvicornWorker -b 0.0.0.0:$PORT
+
+Each worker runs an event loop, so a slow request no longer occupies the whole
+process. Tune the process count with ``WEB_CONCURRENCY`` (gunicorn reads it as
+``--workers``); roughly one worker per CPU core is a good start. For local
+development, ``uvicorn project.asgi:application --reload`` serves the same app.
+
+The Procfile passes ``--preload`` so the application is imported once in the
+gunicorn master and forked into workers; new workers start without repeating
+the imports, which keeps restarts and scale-ups quick.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -1,5 +1,7 @@
 import os
+import threading
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_init
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
@@ -8,4 +10,39 @@ app = Celery('project')
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+@worker_init.connect
+def warm_up_worker(**kwargs):
+    """Imports the delivery dependencies and loads the precompiled email template
+    in the parent process, so prefork children inherit them instead of each
+    paying the cost on its first task
+    """
+    from django.template.loader import get_template
+    from notifications.services import email_sender, weather_client, webhook_sender  # noqa: F401
+    from notifications.services.email_template import email_template_name
+
+    get_template(email_template_name())
+
+@task_prerun.connect
+@task_postrun.connect
+def recycle_db_connections(task=None, **kwargs):
+    """Treats each task like Django treats a request: connections past
+    CONN_MAX_AGE or failing their health check are dropped, healthy ones (or
+    pooled ones, when DATABASE_POOL_MAX_SIZE is set) are kept for the next task.
+    Celery's own fixup would otherwise close them after every task.
+
+    On gevent, eventlet and thread pools each greenlet or thread opens its own
+    connection, so without DATABASE_POOL_MAX_SIZE to cap them they are closed
+    after every task rather than kept up to the concurrency setting
+    """
+    if task is not None and task.request.is_eager:
+        return
+    from django.db import close_old_connections, connection
+    from notifications.services.http_pool import in_green_pool
+
+    pooled = bool(connection.settings_dict.get('OPTIONS', {}).get('pool'))
+    if not pooled and (in_green_pool() or threading.current_thread() is not threading.main_thread()):
+        connection.close()
+    else:
+        close_old_connections()
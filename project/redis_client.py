@@ -0,0 +1,12 @@
+import redis
+from django.conf import settings
+
+
+_connection = None
+
+def get_redis_connection() -> redis.Redis:
+    """Returns a process-wide Redis client for REDIS_URL (the Celery broker by default)"""
+    global _connection
+    if _connection is None:
+        _connection = redis.Redis.from_url(settings.REDIS_URL)
+    return _connection
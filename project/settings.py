@@ -12,14 +12,16 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
-from dotenv import load_dotenv
-import dj_database_url
-
-load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Only local checkouts have a .env file; deployed processes get real environment
+# variables, so skip importing python-dotenv and searching the tree on boot.
+if (BASE_DIR / '.env').is_file():
+    from dotenv import load_dotenv
+    load_dotenv(BASE_DIR / '.env')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
     'users',
     'subscriptions',
     'notifications',
+    'traffic',
 ]
 
 MIDDLEWARE = [
@@ -63,8 +66,13 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'traffic.middleware.traffic_recorder',
 ]
 
+# Record API calls as JSON lines for `manage.py replay_api_traffic`; empty disables it.
+API_TRAFFIC_LOG = os.getenv('API_TRAFFIC_LOG', '')
+API_TRAFFIC_PATHS = ['/api/subscriptions/', '/api/users/token/']
+
 ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
@@ -90,10 +98,39 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 DATABASE_URL = os.getenv('DATABASE_URL')
+# Connection reuse for web and worker processes, in one of three modes:
+#  - default: persistent connections kept for DATABASE_CONN_MAX_AGE seconds
+#  - DATABASE_POOL_MAX_SIZE > 0: Django's native psycopg pool per process, which
+#    also caps connections from a gevent worker at the pool size
+#  - DATABASE_PGBOUNCER: behind pgbouncer in transaction mode; no server-side
+#    cursors or prepared statements, since consecutive queries may hit
+#    different server connections
+# Connections are health-checked before reuse in every mode.
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', '600'))
+DATABASE_POOL_MIN_SIZE = int(os.getenv('DATABASE_POOL_MIN_SIZE', '1'))
+DATABASE_POOL_MAX_SIZE = int(os.getenv('DATABASE_POOL_MAX_SIZE', '0'))
+DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', '10'))
+DATABASE_PGBOUNCER = os.getenv('DATABASE_PGBOUNCER', 'False').lower() == 'true'
+
 if DATABASE_URL:
+    import dj_database_url
     DATABASES = {
-        'default': dj_database_url.config(default=DATABASE_URL, conn_max_age=600)
+        'default': dj_database_url.config(
+            default=DATABASE_URL, conn_max_age=DATABASE_CONN_MAX_AGE, conn_health_checks=True
+        )
     }
+    if DATABASE_PGBOUNCER:
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+        DATABASES['default'].setdefault('OPTIONS', {})['prepare_threshold'] = None
+    elif DATABASE_POOL_MAX_SIZE:
+        # The pool owns connection lifetime, so Django must not keep its own.
+        # CONN_HEALTH_CHECKS above makes Django pass check_connection to it.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            'timeout': DATABASE_POOL_TIMEOUT,
+        }
 else:
     DATABASES = {
         'default': {
@@ -122,9 +159,41 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Preferred password hasher: 'pbkdf2' (Django default), 'scrypt' or 'argon2'
+# (argon2 needs argon2-cffi). The others stay listed so existing hashes still
+# verify and are upgraded to the preferred one on login.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2').lower()
+PASSWORD_HASHERS_BY_NAME = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.TunedScryptPasswordHasher',
+    'argon2': 'users.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHERS_BY_NAME[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHERS_BY_NAME.items() if name != PASSWORD_HASHER
+] + [
+    'users.hashers.ScryptWrappedRegistrationPasswordHasher',
+    'users.hashers.RegistrationPBKDF2PasswordHasher',
+]
+
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', '2'))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', '65536'))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', '2'))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', str(2 ** 14)))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.getenv('PASSWORD_SCRYPT_BLOCK_SIZE', '8'))
+PASSWORD_SCRYPT_PARALLELISM = int(os.getenv('PASSWORD_SCRYPT_PARALLELISM', '1'))
+
+# Registration stores a cheap hash and a Celery task wraps it in scrypt,
+# keeping slow hashing off the web workers during signup bursts.
+PASSWORD_HASH_OFFLOAD = os.getenv('PASSWORD_HASH_OFFLOAD', 'False').lower() == 'true'
+
+# Stateless mode builds the request user from token claims and only checks
+# the users table for revocation, at most once per cache period per user.
+JWT_STATELESS_AUTH = os.getenv('JWT_STATELESS_AUTH', 'False').lower() == 'true'
+JWT_USER_STATUS_CACHE_SECONDS = int(os.getenv('JWT_USER_STATUS_CACHE_SECONDS', '30'))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ConfigurableJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -137,6 +206,8 @@ from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.EmailTokenObtainPairSerializer',
+    'TOKEN_USER_CLASS': 'users.authentication.ClaimsTokenUser',
 }
 
 # Internationalization
@@ -165,15 +236,110 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_TIMEZONE = 'UTC'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Each stage of a notification run has its own queue so a slow weather API or
+# webhook endpoint cannot starve email delivery; see the Procfile for the pools.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'notifications.tasks.process_and_send_notifications': {'queue': 'planner'},
+    'notifications.tasks.fetch_weather_and_dispatch': {'queue': 'weather'},
+    'notifications.tasks.deliver_email': {'queue': 'email'},
+    'notifications.tasks.deliver_email_digest': {'queue': 'email'},
+    'notifications.tasks.deliver_webhook': {'queue': 'webhook'},
+}
+# Acknowledge after the task finishes so a crashed worker's message is redelivered,
+# and reserve one message at a time so long tasks don't hold others hostage. The
+# delivery workers' tasks are short, so the Procfile raises it per queue with
+# EMAIL_PREFETCH_MULTIPLIER and WEBHOOK_PREFETCH_MULTIPLIER.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', '1'))
+# Celery closes database connections after every task unless told to reuse them.
+# Reuse is handled per task in project.celery; this only forces a periodic reset.
+CELERY_DB_REUSE_MAX = int(os.getenv('CELERY_DB_REUSE_MAX', '1000'))
+
+# Outbound delivery over HTTP. The email and webhook queues run on a gevent pool
+# (see the Procfile), so size the keep-alive pool to the larger concurrency;
+# a smaller pool discards connections (benchmarks/delivery_pools_report.txt).
+DELIVERY_HTTP_POOL_SIZE = int(os.getenv('DELIVERY_HTTP_POOL_SIZE', '200'))
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', '10'))
+
+# Failed deliveries are retried with exponential backoff and full jitter, then
+# parked as FailedDelivery rows for `manage.py replay_failed_deliveries`.
+# Keep the total backoff below the shortest notification period (one hour).
+DELIVERY_MAX_RETRIES = int(os.getenv('DELIVERY_MAX_RETRIES', '5'))
+DELIVERY_RETRY_BACKOFF = int(os.getenv('DELIVERY_RETRY_BACKOFF', '30'))  # seconds before the first retry
+DELIVERY_RETRY_BACKOFF_MAX = int(os.getenv('DELIVERY_RETRY_BACKOFF_MAX', '600'))
+
 OPENWEATHERMAP_API_KEY = os.getenv('OPENWEATHERMAP_API_KEY')
 
+# Weather providers in priority order: 'openweathermap', 'open-meteo' (no key
+# needed) and 'fake' (deterministic readings, no network).
+WEATHER_PROVIDERS = [
+    name.strip() for name in os.getenv('WEATHER_PROVIDERS', 'openweathermap').split(',') if name.strip()
+]
+# Race the second provider against a slow primary. The hedge fires after the
+# primary's observed p95 latency, or WEATHER_HEDGE_DELAY seconds until known.
+WEATHER_HEDGING = os.getenv('WEATHER_HEDGING', 'False').lower() == 'true'
+WEATHER_HEDGE_DELAY = float(os.getenv('WEATHER_HEDGE_DELAY', '1.0'))
+
+# Shared call budget for the API key, tracked in Redis. 0 disables the limiter.
+# When the budget runs low, the most subscribed cities are fetched first and the
+# rest fall back to their last cached reading.
+OPENWEATHERMAP_DAILY_QUOTA = int(os.getenv('OPENWEATHERMAP_DAILY_QUOTA', '0'))
+OPENWEATHERMAP_CALLS_PER_MINUTE = int(os.getenv('OPENWEATHERMAP_CALLS_PER_MINUTE', '60'))
+OPENWEATHERMAP_DEFAULT_RETRY_AFTER = 60  # seconds, when a 429 has no usable Retry-After
+OPENWEATHERMAP_BACKOFF_WINDOW = 600  # seconds the per-minute limit stays reduced after a 429
+OPENWEATHERMAP_FALLBACK_TTL = int(os.getenv('OPENWEATHERMAP_FALLBACK_TTL', str(6 * 3600)))
+
+# Seconds a run's published readings stay in Redis for its delivery tasks. Keep it
+# above the delivery retry window; later replays fetch a fresh reading instead.
+WEATHER_READING_TTL = int(os.getenv('WEATHER_READING_TTL', str(2 * 3600)))
+# Seconds a later batch of the same planner run may reuse a reading an earlier
+# batch fetched; older ones are fetched again. Independent of the TTL above,
+# which only keeps readings around for deliveries.
+WEATHER_READING_REUSE_WINDOW = int(os.getenv('WEATHER_READING_REUSE_WINDOW', '600'))
+
+# Thresholds for subscriptions in notify-on-change mode: send only when the
+# temperature moved by at least this many degrees or the description changed.
+NOTIFY_ON_CHANGE_TEMP_DELTA = float(os.getenv('NOTIFY_ON_CHANGE_TEMP_DELTA', '2.0'))
+NOTIFY_ON_CHANGE_DESCRIPTION = os.getenv('NOTIFY_ON_CHANGE_DESCRIPTION', 'True').lower() == 'true'
+
+# Maximum number of items accepted by /api/subscriptions/bulk/.
+SUBSCRIPTION_BULK_LIMIT = int(os.getenv('SUBSCRIPTION_BULK_LIMIT', '500'))
+
+# Let the planner read due subscriptions from a Redis sorted set kept current by
+# model signals, instead of scanning the table each run. After turning it on for
+# an existing database, run `manage.py rebuild_due_schedule` once.
+SUBSCRIPTION_DUE_SCHEDULE = os.getenv('SUBSCRIPTION_DUE_SCHEDULE', 'False').lower() == 'true'
+# Make subscriptions due 15 minutes after their last check instead of on their
+# period, for manual testing. Defaults to on when beat runs a custom minute
+# schedule; set it for web and worker processes alike so they score the same.
+SUBSCRIPTION_TESTING_SCHEDULE = os.getenv(
+    'SUBSCRIPTION_TESTING_SCHEDULE', str('CELERY_BEAT_MINUTE_SCHEDULE' in os.environ)
+).lower() == 'true'
+
+# Seconds a planner run may take before it checkpoints and re-enqueues itself,
+# kept under the hourly beat interval; also the planner's Celery soft time limit.
+PLANNER_RUN_BUDGET = int(os.getenv('PLANNER_RUN_BUDGET', '3000'))
+# Due subscriptions handed to each weather task, and planned between checkpoints.
+PLANNER_BATCH_SIZE = int(os.getenv('PLANNER_BATCH_SIZE', '5000'))
+
+# Seconds before a process reloads the in-memory city alias index.
+CITY_INDEX_TTL = int(os.getenv('CITY_INDEX_TTL', '300'))
+
+# Geohash precision used to share one weather reading between nearby cities
+# (4 is roughly 39x20 km cells, 5 roughly 5x5 km). 0 fetches every city by name.
+WEATHER_GRID_PRECISION = int(os.getenv('WEATHER_GRID_PRECISION', '0'))
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@weather-reminder.com'
 
@@ -1,5 +1,57 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Subscription
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .cities import CITY_FILTER_CACHE_KEY
+from .models import City, Subscription
+
+
+class EstimatedCountPaginator(Paginator):
+    """Uses PostgreSQL's planner statistics for the unfiltered row count.
+    An exact COUNT(*) over millions of subscriptions is what makes the
+    changelist time out; filtered or small tables still get the exact count
+    """
+    EXACT_COUNT_THRESHOLD = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return super().count
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        estimate = row[0] if row else -1
+        if estimate < self.EXACT_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class CityListFilter(admin.SimpleListFilter):
+    """Filters by the canonical city, listing choices from the small City
+    table (cached) rather than a DISTINCT over every subscription
+    """
+    title = 'city'
+    parameter_name = 'location'
+
+    def lookups(self, request, model_admin):
+        return cache.get_or_set(
+            CITY_FILTER_CACHE_KEY,
+            lambda: list(City.objects.values_list('id', 'name')),
+            settings.CITY_INDEX_TTL,
+        )
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(location_id=self.value())
+        return queryset
 
 
 @admin.register(Subscription)
@@ -12,5 +64,16 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'is_active',
         'last_notified_at'
     )
-    list_filter = ('is_active', 'notification_method', 'city')
+    list_filter = ('is_active', 'notification_method', CityListFilter)
+    list_select_related = ('user',)
+    # Both fields have trigram indexes on PostgreSQL for icontains lookups.
     search_fields = ('city', 'user__email')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('user', 'location')
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    list_display = ('name', 'latitude', 'longitude')
+    search_fields = ('name',)
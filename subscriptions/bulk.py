@@ -0,0 +1,138 @@
+from django.db import transaction
+from django.utils import timezone
+from .cities import resolve_cities
+from .models import Subscription
+from .schedule import schedule_subscriptions
+from .serializers import SubscriptionSerializer
+
+
+DUPLICATE_CITY_ERROR = {'city': ['You already have an active subscription for this city.']}
+
+
+class BulkValidationError(Exception):
+    """Raised with per-item errors when any item of a bulk request is invalid"""
+
+    def __init__(self, errors: list):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _check_unique_active_cities(user_id, candidates, errors, exclude_ids=()):
+    """Flags items that would create a second active subscription for a city,
+    against the database (one query) and within the batch itself.
+    `candidates` is a list of (index, city, is_active) tuples
+    """
+    active = [(index, city) for index, city, is_active in candidates if is_active]
+    existing = set(
+        Subscription.objects
+        .filter(user_id=user_id, is_active=True, city__in={city for _, city in active})
+        .exclude(id__in=exclude_ids)
+        .values_list('city', flat=True)
+    )
+    seen = set()
+    for index, city in active:
+        if city in existing or city in seen:
+            errors.append({'index': index, 'errors': DUPLICATE_CITY_ERROR})
+        seen.add(city)
+
+def _raise_if_errors(errors):
+    if errors:
+        raise BulkValidationError(sorted(errors, key=lambda error: error['index']))
+
+def _coerce_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _refetch(ids):
+    return list(Subscription.objects.filter(id__in=ids).order_by('id'))
+
+def bulk_create_subscriptions(user_id, items: list, context: dict) -> list:
+    """Validates every item, then inserts them all with a single bulk_create"""
+    errors, validated = [], []
+    for index, item in enumerate(items):
+        serializer = SubscriptionSerializer(data=item, context=context)
+        if serializer.is_valid():
+            validated.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+
+    _check_unique_active_cities(
+        user_id, [(index, data['city'], data.get('is_active', True)) for index, data in validated], errors
+    )
+    _raise_if_errors(errors)
+
+    with transaction.atomic():
+        # bulk_create skips Subscription.save, so resolve the locations here, all at once.
+        cities = resolve_cities({data['city'] for _, data in validated})
+        subscriptions = []
+        for _, data in validated:
+            location_id, city = cities[data['city']]
+            subscriptions.append(Subscription(**{**data, 'city': city}, user_id=user_id, location_id=location_id))
+        created = Subscription.objects.bulk_create(subscriptions)
+    # Bulk writes skip the model signals that keep the due schedule current.
+    schedule_subscriptions(created)
+    return _refetch([subscription.id for subscription in created])
+
+def bulk_update_subscriptions(user_id, items: list, context: dict) -> list:
+    """Applies partial updates to the user's subscriptions with a single bulk_update.
+    Each item must include the `id` of the subscription it changes
+    """
+    ids = [_coerce_id(item.get('id')) if isinstance(item, dict) else None for item in items]
+    instances = Subscription.objects.filter(user_id=user_id).in_bulk([pk for pk in ids if pk is not None])
+
+    errors, updated, relocated, candidates, fields = [], [], [], [], {'updated_at'}
+    for index, (item, pk) in enumerate(zip(items, ids)):
+        instance = instances.get(pk)
+        if instance is None:
+            errors.append({'index': index, 'errors': {'id': ['Subscription not found.']}})
+            continue
+
+        serializer = SubscriptionSerializer(instance, data=item, partial=True, context=context)
+        if not serializer.is_valid():
+            errors.append({'index': index, 'errors': serializer.errors})
+            continue
+
+        for attr, value in serializer.validated_data.items():
+            setattr(instance, attr, value)
+        fields.update(serializer.validated_data)
+        if 'city' in serializer.validated_data:
+            relocated.append(instance)
+            fields.add('location')
+        updated.append(instance)
+        candidates.append((index, instance.city, instance.is_active))
+
+    _check_unique_active_cities(user_id, candidates, errors, exclude_ids=[instance.id for instance in updated])
+    _raise_if_errors(errors)
+
+    now = timezone.now()
+    for instance in updated:
+        # bulk_update does not apply auto_now.
+        instance.updated_at = now
+
+    with transaction.atomic():
+        # Resolved only now, so a rejected batch never creates a City.
+        cities = resolve_cities({instance.city for instance in relocated})
+        for instance in relocated:
+            instance.location_id, instance.city = cities[instance.city]
+        Subscription.objects.bulk_update(updated, fields=sorted(fields))
+    schedule_subscriptions(updated)
+    return _refetch([instance.id for instance in updated])
+
+def bulk_delete_subscriptions(user_id, ids: list) -> int:
+    """Deletes the given subscriptions of the user, all or nothing"""
+    pks = [_coerce_id(value) for value in ids]
+    existing = set(
+        Subscription.objects.filter(user_id=user_id, id__in=[pk for pk in pks if pk is not None])
+        .values_list('id', flat=True)
+    )
+    errors = [
+        {'index': index, 'errors': {'id': ['Subscription not found.']}}
+        for index, pk in enumerate(pks) if pk not in existing
+    ]
+    _raise_if_errors(errors)
+
+    with transaction.atomic():
+        deleted, _ = Subscription.objects.filter(user_id=user_id, id__in=existing).delete()
+    return deleted
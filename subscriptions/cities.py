@@ -0,0 +1,195 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import City
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash_encode(latitude: float, longitude: float, precision: int) -> str:
+    """Encodes a coordinate as a geohash of `precision` characters.
+    Precision 4 cells are roughly 39x20 km, precision 5 roughly 5x5 km
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+def geohash_center(geohash: str):
+    """Returns the (latitude, longitude) at the centre of a geohash cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if bits >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+def normalize_city_name(value: str) -> str:
+    """Collapses whitespace and title-cases a city name (e.g. ' new  york' -> 'New York')"""
+    return ' '.join(value.split()).title()
+
+def city_key(value: str) -> str:
+    """The lookup key used for canonical names and aliases"""
+    return ' '.join(value.split()).casefold()
+
+
+def _city_cell(latitude, longitude):
+    precision = settings.WEATHER_GRID_PRECISION
+    if not precision or latitude is None or longitude is None:
+        return None
+    return geohash_encode(latitude, longitude, precision)
+
+
+class CityIndex:
+    """In-memory map from canonical names and aliases to (city id, canonical name),
+    plus the WEATHER_GRID_PRECISION grid cell and coordinates of every city that has them.
+    Loaded lazily on first use, refreshed when cities change in this process
+    and reloaded after CITY_INDEX_TTL seconds to pick up changes made elsewhere
+    """
+
+    def __init__(self):
+        self._entries = None
+        self._cells = None
+        self._coordinates = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        cities = list(City.objects.values_list('id', 'name', 'aliases', 'latitude', 'longitude'))
+        entries, cells, coordinates = {}, {}, {}
+        for city_id, name, aliases, *_ in cities:
+            for alias in aliases or []:
+                entries[city_key(alias)] = (city_id, name)
+        # Canonical names always win over a clashing alias.
+        for city_id, name, _, latitude, longitude in cities:
+            entries[city_key(name)] = (city_id, name)
+            cell = _city_cell(latitude, longitude)
+            if cell:
+                cells[name] = cell
+                coordinates[name] = (latitude, longitude)
+        return entries, cells, coordinates
+
+    def _ensure_loaded(self):
+        if self._entries is None or time.monotonic() - self._loaded_at > settings.CITY_INDEX_TTL:
+            self._entries, self._cells, self._coordinates = self._load()
+            self._loaded_at = time.monotonic()
+
+    def lookup(self, name: str):
+        """Returns (city id, canonical name) for a name or alias, or None"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._entries.get(city_key(name))
+
+    def cell_for(self, name: str):
+        """Returns the grid cell of a canonical city, or None when the grid is
+        disabled or the city has no coordinates
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return self._cells.get(name)
+
+    def coordinates_for(self, name: str):
+        """Returns the (latitude, longitude) of a canonical city that has a grid
+        cell, or None
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return self._coordinates.get(name)
+
+    def add(self, city: City):
+        """Registers a saved city without reloading the whole table"""
+        with self._lock:
+            if self._entries is None:
+                return
+            for alias in city.aliases or []:
+                self._entries.setdefault(city_key(alias), (city.id, city.name))
+            self._entries[city_key(city.name)] = (city.id, city.name)
+            cell = _city_cell(city.latitude, city.longitude)
+            if cell:
+                self._cells[city.name] = cell
+                self._coordinates[city.name] = (city.latitude, city.longitude)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+            self._cells = None
+            self._coordinates = None
+
+
+city_index = CityIndex()
+
+# Cached (id, name) choices for the admin's city filter, cleared on City changes.
+CITY_FILTER_CACHE_KEY = 'admin:subscription_city_filter'
+
+def canonical_city_name(name: str) -> str:
+    """Returns the canonical spelling for a name or alias without touching the database
+    for unknown cities
+    """
+    match = city_index.lookup(name)
+    return match[1] if match else normalize_city_name(name)
+
+def resolve_city(name: str):
+    """Returns (city id, canonical name), creating a City for names seen for the first time"""
+    match = city_index.lookup(name)
+    if match:
+        return match
+    city, _ = City.objects.get_or_create(name=normalize_city_name(name))
+    # The index is process-wide; a city from a rolled-back transaction must never reach it.
+    transaction.on_commit(lambda: city_index.add(city))
+    return city.id, city.name
+
+def resolve_cities(names) -> dict:
+    """Maps each name to (city id, canonical name) like `resolve_city`, with a
+    constant number of queries however many of the cities are new
+    """
+    resolved, unknown = {}, {}
+    for name in names:
+        match = city_index.lookup(name)
+        if match:
+            resolved[name] = match
+        else:
+            unknown.setdefault(normalize_city_name(name), []).append(name)
+    if not unknown:
+        return resolved
+
+    cities = {city.name: city for city in City.objects.filter(name__in=unknown)}
+    missing = [name for name in unknown if name not in cities]
+    if missing:
+        # Another request may create the same city meanwhile; keep whichever row won.
+        City.objects.bulk_create([City(name=name) for name in missing], ignore_conflicts=True)
+        cities.update((city.name, city) for city in City.objects.filter(name__in=missing))
+
+    def publish():
+        # bulk_create sends no signals, so do what refresh_city_index_on_save would.
+        cache.delete(CITY_FILTER_CACHE_KEY)
+        for city in cities.values():
+            city_index.add(city)
+    transaction.on_commit(publish)
+
+    for canonical, aliases in unknown.items():
+        city = cities[canonical]
+        for name in aliases:
+            resolved[name] = (city.id, city.name)
+    return resolved
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from project.redis_client import get_redis_connection
+from subscriptions.schedule import DueSchedule
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the Redis due schedule of active subscriptions from the database'
+
+    def handle(self, *args, **kwargs):
+        total = DueSchedule(get_redis_connection()).rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Scheduled {total} active subscriptions.'))
@@ -3,7 +3,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from faker import Faker
 from users.models import User
-from subscriptions.models import Subscription
+from subscriptions.models import City, Subscription
 
 
 class Command(BaseCommand):
@@ -30,17 +30,25 @@ class Command(BaseCommand):
                 user.save()
             users.append(user)
 
-        cities = [
-            'London',
-            'Paris',
-            'New York',
-            'Tokyo', 'Sydney',
-            'Berlin',
-            'Kyiv',
-            'Dubai',
-            'Toronto',
-            'Rome'
+        city_catalog = [
+            ('London', [], 51.5074, -0.1278),
+            ('Paris', [], 48.8566, 2.3522),
+            ('New York', ['NYC', 'New York City'], 40.7128, -74.0060),
+            ('Tokyo', [], 35.6762, 139.6503),
+            ('Sydney', [], -33.8688, 151.2093),
+            ('Berlin', [], 52.5200, 13.4050),
+            ('Kyiv', ['Kiev'], 50.4501, 30.5234),
+            ('Dubai', [], 25.2048, 55.2708),
+            ('Toronto', [], 43.6532, -79.3832),
+            ('Rome', ['Roma'], 41.9028, 12.4964),
         ]
+        for name, aliases, latitude, longitude in city_catalog:
+            City.objects.update_or_create(
+                name=name,
+                defaults={'aliases': aliases, 'latitude': latitude, 'longitude': longitude}
+            )
+
+        cities = [name for name, *_ in city_catalog]
 
         for user in users:
             for _ in range(random.randint(1, 3)):
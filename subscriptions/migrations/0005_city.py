@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_existing_subscriptions(apps, schema_editor):
+    """Creates a City for every distinct subscription city and points subscriptions at it"""
+    City = apps.get_model('subscriptions', 'City')
+    Subscription = apps.get_model('subscriptions', 'Subscription')
+
+    for name in Subscription.objects.values_list('city', flat=True).distinct():
+        canonical = ' '.join(name.split()).title()
+        city, _ = City.objects.get_or_create(name=canonical)
+        Subscription.objects.filter(city=name).update(location=city)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0004_subscription_indexes_and_active_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('aliases', models.JSONField(blank=True, default=list)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'cities',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='subscriptions', to='subscriptions.city'),
+        ),
+        migrations.RunPython(link_existing_subscriptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0005_city'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='last_sent_fingerprint',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='notify_on_change',
+            field=models.BooleanField(default=False, help_text='Only notify when the weather changed since the last delivered reading.'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    """Serves the admin's case-insensitive substring search on city.
+    PostgreSQL only; the pg_trgm extension is created by the users migration
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS sub_city_upper_trgm_idx '
+        'ON subscriptions_subscription USING gin (UPPER(city::text) gin_trgm_ops)'
+    )
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS sub_city_upper_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0006_subscription_notify_on_change'),
+        ('users', '0003_user_email_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_last_notified_at(apps, schema_editor):
+    """Starts every subscription's check time at its last notification"""
+    Subscription = apps.get_model('subscriptions', 'Subscription')
+    Subscription.objects.filter(last_notified_at__isnull=False).update(last_checked_at=F('last_notified_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0007_subscription_city_trigram_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='sub_active_period_notified_idx',
+        ),
+        migrations.AddField(
+            model_name='subscription',
+            name='last_checked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(copy_last_notified_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['notification_period', 'last_checked_at'], name='sub_active_period_checked_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def canonicalize_subscription_cities(apps, schema_editor):
+    """Rewrites `city` to the name of the linked City, which 0005 left as typed.
+    Active subscriptions of one user that resolve to the same City would then
+    break unique_active_subscription_per_city, so all but the oldest of them
+    are deactivated first
+    """
+    City = apps.get_model('subscriptions', 'City')
+    Subscription = apps.get_model('subscriptions', 'Subscription')
+
+    seen, duplicates = set(), []
+    linked = Subscription.objects.filter(is_active=True, location__isnull=False).order_by('created_at', 'id')
+    for pk, user_id, location_id in linked.values_list('id', 'user_id', 'location_id').iterator():
+        if (user_id, location_id) in seen:
+            duplicates.append(pk)
+        else:
+            seen.add((user_id, location_id))
+    Subscription.objects.filter(id__in=duplicates).update(is_active=False)
+
+    for pk, name in City.objects.values_list('id', 'name').iterator():
+        Subscription.objects.filter(location_id=pk).exclude(city=name).update(city=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0008_subscription_last_checked_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_subscription_cities, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,23 @@ from django.conf import settings
 from django.db import models
 
 
+class City(models.Model):
+    """A canonical location that subscriptions point at.
+    `aliases` holds alternative spellings (e.g. 'NYC') that resolve to this city
+    """
+    name = models.CharField(max_length=100, unique=True)
+    aliases = models.JSONField(default=list, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name_plural = 'cities'
+        ordering = ['name']
+
+
 class Subscription(models.Model):
     class NotificationMethod(models.TextChoices):
         EMAIL = 'email', 'Email'
@@ -19,6 +36,13 @@ class Subscription(models.Model):
         related_name='subscriptions'
     )
     city = models.CharField(max_length=100)
+    location = models.ForeignKey(
+        City,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='subscriptions'
+    )
 
     notification_period = models.IntegerField(choices=NotificationPeriod.choices)
     notification_method = models.CharField(max_length=10, choices=NotificationMethod.choices)
@@ -27,11 +51,55 @@ class Subscription(models.Model):
     is_active = models.BooleanField(default=True)
 
     last_notified_at = models.DateTimeField(null=True, blank=True)
+    # When the planner last handled the subscription, notified or not (e.g.
+    # skipped as unchanged). The due scan and schedule go by this one.
+    last_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
+    notify_on_change = models.BooleanField(
+        default=False,
+        help_text='Only notify when the weather changed since the last delivered reading.'
+    )
+    last_sent_fingerprint = models.JSONField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        """Resolves the city to its canonical name and location on every write
+        that touches it, so admin and seed inserts are normalized too
+        """
+        update_fields = kwargs.get('update_fields')
+        if self.city and (update_fields is None or 'city' in update_fields):
+            from .cities import resolve_city
+
+            self.location_id, self.city = resolve_city(self.city)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'location'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.email} - {self.city} ({self.get_notification_period_display()})"
 
     class Meta:
-        unique_together = ('user', 'city', 'is_active')
+        constraints = [
+            # Only one active subscription per user and city; any number of
+            # deactivated rows may be kept around as history.
+            models.UniqueConstraint(
+                fields=['user', 'city'],
+                condition=models.Q(is_active=True),
+                name='unique_active_subscription_per_city',
+            ),
+        ]
+        indexes = [
+            # Serves the notification scan: active rows filtered by period and
+            # last_checked_at.
+            models.Index(
+                fields=['notification_period', 'last_checked_at'],
+                condition=models.Q(is_active=True),
+                name='sub_active_period_checked_idx',
+            ),
+            # Serves grouping active rows by city and the admin city filter.
+            models.Index(
+                fields=['city'],
+                condition=models.Q(is_active=True),
+                name='sub_active_city_idx',
+            ),
+        ]
@@ -0,0 +1,132 @@
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from redis.exceptions import RedisError
+from project.redis_client import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+TESTING_INTERVAL = timedelta(minutes=14)
+# The fields `DueSchedule` scores a subscription by.
+SCHEDULE_FIELDS = ('id', 'notification_period', 'last_checked_at', 'created_at', 'is_active')
+
+def is_testing_schedule() -> bool:
+    """Whether subscriptions follow the 15-minute cadence used for manual testing.
+    Web and worker processes both score subscriptions, so it is a setting they
+    share rather than the beat process's environment
+    """
+    return settings.SUBSCRIPTION_TESTING_SCHEDULE
+
+def next_due_at(period: int, last_checked_at, created_at, testing: bool = False) -> float:
+    """Returns the earliest timestamp at which the planner may find a subscription due.
+    Production runs send when the hour is a multiple of the period, so this is the
+    next such hour after the planner last handled it (or the hour the subscription
+    was created). The planner still applies its due filter to every candidate, so a
+    score may be early but never late
+    """
+    if testing:
+        return (last_checked_at + TESTING_INTERVAL).timestamp() if last_checked_at else 0.0
+
+    reference = last_checked_at or created_at or datetime.now(dt_timezone.utc)
+    hour = reference.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if last_checked_at:
+        hour += timedelta(hours=1)
+    while hour.hour % period:
+        hour += timedelta(hours=1)
+    return hour.timestamp()
+
+
+class DueSchedule:
+    """Active subscription ids in a Redis sorted set scored by when each is next due.
+
+    Signals keep it current as subscriptions are saved or deleted, and the
+    planner and deliveries move a subscription forward once it has been handled, so the planner finds
+    candidates with one ZRANGEBYSCORE instead of scanning the table. `rebuild`
+    recreates it from the database at any time
+    """
+    KEY = 'subscriptions:due'
+    BATCH_SIZE = 5000
+
+    def __init__(self, connection):
+        self.redis = connection
+
+    @classmethod
+    def from_settings(cls):
+        """Returns the schedule, or None unless SUBSCRIPTION_DUE_SCHEDULE is on"""
+        if not settings.SUBSCRIPTION_DUE_SCHEDULE:
+            return None
+        return cls(get_redis_connection())
+
+    def exists(self) -> bool:
+        return bool(self.redis.exists(self.KEY))
+
+    def _scores(self, subscriptions) -> dict:
+        testing = is_testing_schedule()
+        return {
+            sub.id: next_due_at(sub.notification_period, sub.last_checked_at, sub.created_at, testing)
+            for sub in subscriptions
+        }
+
+    def update(self, subscriptions):
+        """Schedules the active subscriptions given and drops the inactive ones"""
+        subscriptions = list(subscriptions)
+        scores = self._scores(sub for sub in subscriptions if sub.is_active)
+        inactive = [sub.id for sub in subscriptions if not sub.is_active]
+        with self.redis.pipeline(transaction=False) as pipe:
+            if scores:
+                pipe.zadd(self.KEY, scores)
+            if inactive:
+                pipe.zrem(self.KEY, *inactive)
+            pipe.execute()
+
+    def remove(self, ids):
+        ids = list(ids)
+        if ids:
+            self.redis.zrem(self.KEY, *ids)
+
+    def due_ids(self, now) -> list:
+        return [int(pk) for pk in self.redis.zrangebyscore(self.KEY, '-inf', now.timestamp())]
+
+    def rebuild(self) -> int:
+        """Recreates the set from the active subscriptions, swapping it in atomically"""
+        from .models import Subscription
+
+        staging = f'{self.KEY}:rebuild'
+        self.redis.delete(staging)
+        active = (
+            Subscription.objects.filter(is_active=True)
+            .only(*SCHEDULE_FIELDS)
+            .iterator(chunk_size=self.BATCH_SIZE)
+        )
+        total, batch = 0, {}
+        for sub in active:
+            batch.update(self._scores([sub]))
+            if len(batch) >= self.BATCH_SIZE:
+                self.redis.zadd(staging, batch)
+                total, batch = total + len(batch), {}
+        if batch:
+            self.redis.zadd(staging, batch)
+            total += len(batch)
+
+        if total:
+            self.redis.rename(staging, self.KEY)
+        else:
+            self.redis.delete(self.KEY)
+        return total
+
+
+def schedule_subscriptions(subscriptions=(), removed_ids=()):
+    """Applies subscription changes to the due schedule when it is enabled.
+    Redis errors are logged rather than raised so writes never fail on them;
+    the planner re-checks candidates against the database and `rebuild_due_schedule`
+    repairs any drift
+    """
+    schedule = DueSchedule.from_settings()
+    if schedule is None:
+        return
+    try:
+        schedule.update(subscriptions)
+        schedule.remove(removed_ids)
+    except RedisError:
+        logger.warning('Could not update the subscription due schedule', exc_info=True)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .cities import canonical_city_name
 from .models import Subscription
 
 
@@ -12,14 +13,14 @@ class CaseInsensitiveChoiceField(serializers.ChoiceField):
 
 class SubscriptionSerializer(serializers.HyperlinkedModelSerializer):
 
-    user = serializers.ReadOnlyField(source='user.email')
+    user = serializers.SerializerMethodField()
     notification_method = CaseInsensitiveChoiceField(choices=Subscription.NotificationMethod.choices)
 
     class Meta:
         model = Subscription
         fields = [
             'url', 'id', 'user', 'city', 'notification_period',
-            'notification_method', 'webhook_url', 'is_active',
+            'notification_method', 'webhook_url', 'is_active', 'notify_on_change',
             'last_notified_at', 'created_at', 'updated_at'
         ]
         read_only_fields = ['last_notified_at', 'created_at', 'updated_at']
@@ -28,6 +29,16 @@ class SubscriptionSerializer(serializers.HyperlinkedModelSerializer):
             'url': {'view_name': 'subscription-detail', 'lookup_field': 'pk'}
         }
 
+    def get_user(self, obj) -> str:
+        """The owner's email. The API only serves the request user's own
+        subscriptions, so it comes from the request user (the token claims
+        under stateless auth) instead of a JOIN on the users table
+        """
+        request = self.context.get('request')
+        if request is not None and str(request.user.id) == str(obj.user_id):
+            return request.user.email
+        return obj.user.email
+
     def validate(self, data):
         """Check that webhook_url is provided
         if notification_method is 'webhook'
@@ -41,13 +52,39 @@ class SubscriptionSerializer(serializers.HyperlinkedModelSerializer):
             )
         if method == 'email':
             data['webhook_url'] = None
+
+        self._validate_unique_active_city(data)
         return data
 
+    def _validate_unique_active_city(self, data):
+        """Mirrors the conditional unique constraint on active subscriptions
+        so duplicates are reported as a 400 instead of an IntegrityError.
+        Bulk requests check the whole batch with one query instead
+        """
+        if self.context.get('bulk'):
+            return
+
+        instance = self.instance
+        city = data.get('city', instance.city if instance else None)
+        is_active = data.get('is_active', instance.is_active if instance else True)
+        if not city or not is_active:
+            return
+
+        user_id = instance.user_id if instance else self.context['request'].user.id
+        duplicates = Subscription.objects.filter(user_id=user_id, city=city, is_active=True)
+        if instance:
+            duplicates = duplicates.exclude(pk=instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError(
+                {'city': 'You already have an active subscription for this city.'}
+            )
+
     def validate_city(self, value):
         """Normalizes the city name to a consistent format
-        - Removes leading/trailing whitespace
-        - Capitalizes the city in title case (e.g., 'new york' -> 'New York')
+        - Resolves known aliases to the canonical city (e.g., 'NYC' -> 'New York')
+        - Otherwise removes extra whitespace and capitalizes the city in title case
+          (e.g., 'new york' -> 'New York')
         """
         if not isinstance(value, str):
             raise serializers.ValidationError('City must be a string.')
-        return value.strip().title()
\ No newline at end of file
+        return canonical_city_name(value)
\ No newline at end of file
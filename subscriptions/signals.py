@@ -0,0 +1,33 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cities import CITY_FILTER_CACHE_KEY, city_index
+from .models import City, Subscription
+from .schedule import schedule_subscriptions
+
+
+@receiver(post_save, sender=City)
+def refresh_city_index_on_save(sender, instance, created, **kwargs):
+    """New cities are added in place; edits may drop aliases, so reload.
+    Both wait for the commit so a rollback never leaves the index pointing at
+    rows that do not exist
+    """
+    cache.delete(CITY_FILTER_CACHE_KEY)
+    if created:
+        transaction.on_commit(lambda: city_index.add(instance))
+    else:
+        transaction.on_commit(city_index.invalidate)
+
+@receiver(post_delete, sender=City)
+def refresh_city_index_on_delete(sender, instance, **kwargs):
+    cache.delete(CITY_FILTER_CACHE_KEY)
+    transaction.on_commit(city_index.invalidate)
+
+@receiver(post_save, sender=Subscription)
+def schedule_subscription_on_save(sender, instance, **kwargs):
+    schedule_subscriptions([instance])
+
+@receiver(post_delete, sender=Subscription)
+def unschedule_subscription_on_delete(sender, instance, **kwargs):
+    schedule_subscriptions(removed_ids=[instance.id])
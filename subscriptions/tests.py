@@ -1,8 +1,17 @@
+import io
+from importlib import import_module
 import pytest
+from datetime import datetime, timezone as dt_timezone
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 from users.models import User
-from .models import Subscription
+from .cities import city_index, geohash_center, geohash_encode
+from .models import City, Subscription
+from .schedule import DueSchedule, next_due_at
+from .views import SubscriptionViewSet
 
 
 @pytest.fixture
@@ -195,4 +204,368 @@ class TestSubscriptionAPI:
         response = authenticated_client.post('/api/subscriptions/', data=payload)
 
         assert response.status_code == status.HTTP_201_CREATED
-        assert response.data['city'] == expected_city
\ No newline at end of file
+        assert response.data['city'] == expected_city
+
+    def test_create_duplicate_active_subscription(self, authenticated_client, test_user):
+        """Tests creating a second active subscription for the same city being rejected"""
+        Subscription.objects.create(
+            user=test_user,
+            city='Dubai',
+            notification_period=1,
+            notification_method='email'
+        )
+        payload = {'city': 'dubai', 'notification_period': 3, 'notification_method': 'email'}
+        response = authenticated_client.post('/api/subscriptions/', data=payload, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'city' in response.data
+        assert Subscription.objects.count() == 1
+
+@pytest.mark.django_db
+class TestSubscriptionConstraints:
+    """Groups tests for the Subscription indexes and constraints"""
+
+    def test_only_one_active_subscription_per_city(self, test_user):
+        """Tests the conditional unique constraint rejecting a duplicate active row"""
+        Subscription.objects.create(user=test_user, city='Toronto', notification_period=1, notification_method='email')
+
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Subscription.objects.create(user=test_user, city='Toronto', notification_period=3, notification_method='email')
+
+    def test_inactive_subscriptions_are_not_unique(self, test_user):
+        """Tests any number of deactivated rows being kept for the same city"""
+        for _ in range(3):
+            Subscription.objects.create(
+                user=test_user, city='Toronto', notification_period=1,
+                notification_method='email', is_active=False
+            )
+        Subscription.objects.create(user=test_user, city='Toronto', notification_period=1, notification_method='email')
+
+        assert Subscription.objects.filter(user=test_user, city='Toronto').count() == 4
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='EXPLAIN plans are only checked on PostgreSQL')
+class TestSubscriptionQueryPlans:
+    """Checks the notification scan and city lookups use the partial indexes"""
+
+    @pytest.fixture(autouse=True)
+    def disable_seqscan(self):
+        """Test tables are tiny, so force the planner to consider the indexes"""
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        yield
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = on')
+
+    def test_due_scan_uses_period_index(self):
+        """Tests the due-subscription query being served by the period index"""
+        plan = Subscription.objects.filter(
+            is_active=True, notification_period__in=[1, 3], last_checked_at__isnull=True
+        ).explain()
+
+        assert 'sub_active_period_checked_idx' in plan
+
+    def test_city_lookup_uses_city_index(self):
+        """Tests filtering active subscriptions by city being served by the city index"""
+        plan = Subscription.objects.filter(is_active=True, city='London').explain()
+
+        assert 'sub_active_city_idx' in plan
+
+@pytest.mark.django_db
+class TestCityNormalization:
+    """Groups tests for canonical city resolution"""
+
+    @pytest.fixture
+    def new_york(self):
+        return City.objects.create(name='New York', aliases=['NYC', 'New York City'], latitude=40.71, longitude=-74.01)
+
+    @pytest.mark.parametrize('input_city', ['NYC', 'nyc', 'new york city', ' New  York '])
+    def test_create_subscription_resolves_alias(self, authenticated_client, new_york, input_city):
+        """Tests aliases submitted through the API resolving to the canonical city"""
+        payload = {'city': input_city, 'notification_period': 1, 'notification_method': 'email'}
+        response = authenticated_client.post('/api/subscriptions/', data=payload)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['city'] == 'New York'
+        assert Subscription.objects.get().location == new_york
+
+    def test_model_save_normalizes_city(self, test_user, new_york):
+        """Tests inserts bypassing the serializer (admin, seed data) being normalized too"""
+        subscription = Subscription.objects.create(
+            user=test_user, city='NYC', notification_period=1, notification_method='email'
+        )
+
+        assert subscription.city == 'New York'
+        assert subscription.location_id == new_york.id
+
+    def test_unknown_city_creates_canonical_entry(self, test_user):
+        """Tests a city seen for the first time being added to the catalog"""
+        subscription = Subscription.objects.create(
+            user=test_user, city='  lviv ', notification_period=1, notification_method='email'
+        )
+
+        assert subscription.city == 'Lviv'
+        assert City.objects.filter(name='Lviv', subscriptions=subscription).exists()
+
+    def test_alias_added_later_is_picked_up(self, test_user, new_york, django_capture_on_commit_callbacks):
+        """Tests the alias index refreshing when a city is edited"""
+        assert city_index.lookup('Big Apple') is None
+
+        with django_capture_on_commit_callbacks(execute=True):
+            new_york.aliases.append('Big Apple')
+            new_york.save()
+
+        assert city_index.lookup('big apple') == (new_york.id, 'New York')
+
+    def test_rolled_back_city_stays_out_of_index(self, test_user):
+        """Tests a city created in a transaction that rolls back never reaching the shared index"""
+        with transaction.atomic():
+            Subscription.objects.create(user=test_user, city='Lviv', notification_period=1, notification_method='email')
+            transaction.set_rollback(True)
+
+        assert city_index.lookup('Lviv') is None
+        subscription = Subscription.objects.create(
+            user=test_user, city='Lviv', notification_period=1, notification_method='email'
+        )
+        assert subscription.location.name == 'Lviv'
+
+    def test_migration_rewrites_linked_cities(self, test_user, new_york):
+        """Tests the backfill renaming linked rows and deactivating the duplicates it would create"""
+        from django.apps import apps
+        migration = import_module('subscriptions.migrations.0009_canonical_subscription_city')
+        oldest, newer = (
+            Subscription.objects.create(user=test_user, city=city, notification_period=1, notification_method='email')
+            for city in ('New York', 'Boston')
+        )
+        # Spellings linked by 0005, before the save-time normalization existed.
+        Subscription.objects.filter(pk=oldest.pk).update(city='new york')
+        Subscription.objects.filter(pk=newer.pk).update(city='NYC', location=new_york)
+        unlinked = Subscription.objects.create(user=test_user, city='Lviv', notification_period=1, notification_method='email')
+        Subscription.objects.filter(pk=unlinked.pk).update(location=None, city='lviv')
+
+        migration.canonicalize_subscription_cities(apps, None)
+
+        assert list(Subscription.objects.order_by('id').values_list('city', 'is_active')) == [
+            ('New York', True), ('New York', False), ('lviv', True)
+        ]
+
+class TestGeohash:
+    """Groups tests for the geohash helpers behind grid weather sharing"""
+
+    def test_encode_known_value(self):
+        assert geohash_encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+    def test_center_round_trip(self):
+        latitude, longitude = geohash_center('u4pruydqqvj')
+
+        assert latitude == pytest.approx(57.64911, abs=1e-4)
+        assert longitude == pytest.approx(10.40744, abs=1e-4)
+
+def test_subscription_views_are_async():
+    """Tests the subscription API being served by async views under ASGI"""
+    assert SubscriptionViewSet.view_is_async
+
+@pytest.mark.django_db
+class TestBulkSubscriptionAPI:
+    """Groups tests for the bulk create/update/delete endpoint"""
+
+    url = '/api/subscriptions/bulk/'
+
+    def test_bulk_create(self, authenticated_client, test_user):
+        """Tests creating many subscriptions in one request"""
+        payload = [
+            {'city': 'london', 'notification_period': 1, 'notification_method': 'email'},
+            {'city': 'Paris', 'notification_period': 3, 'notification_method': 'webhook',
+             'webhook_url': 'http://example.com/hook'},
+        ]
+        response = authenticated_client.post(self.url, data=payload, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [item['city'] for item in response.data] == ['London', 'Paris']
+        assert all(item['user'] == test_user.email for item in response.data)
+        assert Subscription.objects.filter(user=test_user, location__isnull=False).count() == 2
+
+    def test_bulk_create_reports_errors_per_item(self, authenticated_client, test_user):
+        """Tests an invalid item rejecting the whole batch with its index reported"""
+        Subscription.objects.create(user=test_user, city='Rome', notification_period=1, notification_method='email')
+        payload = [
+            {'city': 'Berlin', 'notification_period': 1, 'notification_method': 'email'},
+            {'city': 'Oslo', 'notification_period': 5, 'notification_method': 'email'},
+            {'city': 'rome', 'notification_period': 1, 'notification_method': 'email'},
+            {'city': 'Berlin', 'notification_period': 3, 'notification_method': 'email'},
+        ]
+        response = authenticated_client.post(self.url, data=payload, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error['index'] for error in response.data['errors']] == [1, 2, 3]
+        assert 'notification_period' in response.data['errors'][0]['errors']
+        assert Subscription.objects.count() == 1
+
+    def test_bulk_create_uses_constant_queries(self, authenticated_client, django_assert_max_num_queries):
+        """Tests validation, uniqueness checks and new cities not issuing a query per item"""
+        City.objects.bulk_create([City(name=f'Town {index}') for index in range(0, 50, 2)])
+        payload = [
+            {'city': f'Town {index}', 'notification_period': 1, 'notification_method': 'email'}
+            for index in range(50)
+        ]
+        with django_assert_max_num_queries(10):
+            response = authenticated_client.post(self.url, data=payload, format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Subscription.objects.filter(location__isnull=False).count() == 50
+        assert City.objects.count() == 50
+
+    def test_bulk_limit(self, authenticated_client, settings):
+        """Tests requests over the configured item limit being rejected"""
+        settings.SUBSCRIPTION_BULK_LIMIT = 2
+        payload = [{'city': 'Kyiv', 'notification_period': 1, 'notification_method': 'email'}] * 3
+        response = authenticated_client.post(self.url, data=payload, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_bulk_update(self, authenticated_client, test_user):
+        """Tests updating several subscriptions in one request"""
+        first = Subscription.objects.create(user=test_user, city='Kyiv', notification_period=1, notification_method='email')
+        second = Subscription.objects.create(user=test_user, city='Dubai', notification_period=1, notification_method='email')
+        payload = [
+            {'id': first.id, 'notification_period': 12},
+            {'id': second.id, 'city': 'toronto', 'is_active': False},
+        ]
+        response = authenticated_client.patch(self.url, data=payload, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert first.notification_period == 12
+        assert (second.city, second.is_active, second.location.name) == ('Toronto', False, 'Toronto')
+
+    def test_rejected_bulk_update_creates_no_city(self, authenticated_client, test_user):
+        """Tests a batch rejected by validation leaving the City catalog and index untouched"""
+        first = Subscription.objects.create(user=test_user, city='Kyiv', notification_period=1, notification_method='email')
+        second = Subscription.objects.create(user=test_user, city='Dubai', notification_period=1, notification_method='email')
+        payload = [
+            {'id': first.id, 'city': 'toronto'},
+            {'id': second.id, 'notification_period': 5},
+        ]
+        response = authenticated_client.patch(self.url, data=payload, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not City.objects.filter(name='Toronto').exists()
+        assert city_index.lookup('Toronto') is None
+
+    def test_bulk_update_rejects_other_users_subscriptions(self, authenticated_client):
+        """Tests ids belonging to another user being reported as not found"""
+        other_user = User.objects.create_user(email='other@example.com', password='pw')
+        other = Subscription.objects.create(user=other_user, city='Rome', notification_period=1, notification_method='email')
+        response = authenticated_client.patch(self.url, data=[{'id': other.id, 'notification_period': 3}], format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['errors'][0]['index'] == 0
+        other.refresh_from_db()
+        assert other.notification_period == 1
+
+    def test_bulk_delete(self, authenticated_client, test_user):
+        """Tests deleting several subscriptions in one request"""
+        ids = [
+            Subscription.objects.create(user=test_user, city=city, notification_period=1, notification_method='email').id
+            for city in ('Kyiv', 'Rome', 'Paris')
+        ]
+        response = authenticated_client.delete(self.url, data=ids[:2], format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['deleted'] == 2
+        assert list(Subscription.objects.values_list('id', flat=True)) == ids[2:]
+
+@pytest.mark.django_db
+class TestSubscriptionAdmin:
+    """Groups tests for the subscription changelist at scale"""
+
+    @pytest.fixture
+    def subscriptions(self):
+        City.objects.create(name='London')
+        for index in range(20):
+            user = User.objects.create_user(email=f'admin-list{index}@example.com', password='pw')
+            Subscription.objects.create(user=user, city='London', notification_period=1, notification_method='email')
+
+    def test_changelist_query_count_is_constant(self, admin_client, subscriptions, django_assert_max_num_queries):
+        """Tests users being joined rather than fetched once per row"""
+        admin_client.get('/admin/subscriptions/subscription/')  # Warm the session and filter cache
+
+        with django_assert_max_num_queries(4):
+            response = admin_client.get('/admin/subscriptions/subscription/')
+
+        assert response.status_code == 200
+        assert b'admin-list19@example.com' in response.content
+
+    def test_city_filter_choices_are_cached(self, admin_client, subscriptions):
+        """Tests the city choices being served from cache until a city changes"""
+        admin_client.get('/admin/subscriptions/subscription/')
+
+        with CaptureQueriesContext(connection) as queries:
+            admin_client.get('/admin/subscriptions/subscription/')
+        City.objects.create(name='Paris')
+        response = admin_client.get('/admin/subscriptions/subscription/')
+
+        assert not any('subscriptions_city' in query['sql'] for query in queries.captured_queries)
+        assert b'Paris' in response.content
+
+
+def _utc(hour, minute=0):
+    return datetime(2025, 1, 1, hour, minute, tzinfo=dt_timezone.utc)
+
+@pytest.mark.parametrize('period, last_checked_at, created_at, expected', [
+    (3, _utc(12, 0), None, _utc(15)),
+    (1, _utc(12, 58), None, _utc(13)),
+    (6, None, _utc(7, 30), _utc(12)),
+    (1, None, _utc(9, 30), _utc(9)),
+])
+def test_next_due_at(period, last_checked_at, created_at, expected):
+    """Tests scores landing on the first hour the planner can find a subscription due"""
+    assert next_due_at(period, last_checked_at, created_at) == expected.timestamp()
+
+@pytest.mark.django_db
+class TestDueSchedule:
+    """Groups tests for the Redis due schedule kept by subscription signals"""
+
+    @pytest.fixture(autouse=True)
+    def enabled(self, settings):
+        settings.SUBSCRIPTION_DUE_SCHEDULE = True
+
+    @pytest.fixture
+    def schedule(self, fake_redis):
+        return DueSchedule(fake_redis)
+
+    def test_signals_keep_schedule_current(self, schedule, test_user):
+        """Tests saves scheduling active subscriptions and removing others"""
+        kept = Subscription.objects.create(user=test_user, city='Oslo', notification_period=1, notification_method='email')
+        paused = Subscription.objects.create(user=test_user, city='Rome', notification_period=1, notification_method='email')
+        deleted = Subscription.objects.create(user=test_user, city='Kyiv', notification_period=1, notification_method='email')
+
+        paused.is_active = False
+        paused.save()
+        deleted.delete()
+
+        assert schedule.redis.zrange(DueSchedule.KEY, 0, -1) == [str(kept.id).encode()]
+
+    def test_bulk_create_is_scheduled(self, schedule, authenticated_client):
+        """Tests subscriptions written with bulk_create still being scheduled"""
+        response = authenticated_client.post('/api/subscriptions/bulk/', [
+            {'city': 'Oslo', 'notification_period': 1, 'notification_method': 'email'},
+            {'city': 'Rome', 'notification_period': 3, 'notification_method': 'email'},
+        ], format='json')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert schedule.redis.zcard(DueSchedule.KEY) == 2
+
+    def test_rebuild_command(self, schedule, test_user):
+        """Tests the schedule being recreated from the active subscriptions"""
+        active = Subscription.objects.create(user=test_user, city='Oslo', notification_period=1, notification_method='email')
+        Subscription.objects.create(
+            user=test_user, city='Rome', notification_period=1, notification_method='email', is_active=False
+        )
+        schedule.redis.delete(DueSchedule.KEY)
+        schedule.redis.zadd(DueSchedule.KEY, {'999': 0})
+
+        call_command('rebuild_due_schedule', stdout=io.StringIO())
+
+        assert schedule.redis.zrange(DueSchedule.KEY, 0, -1) == [str(active.id).encode()]
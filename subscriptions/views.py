@@ -1,17 +1,75 @@
-from rest_framework import viewsets, permissions
+from adrf import viewsets
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from .bulk import (
+    BulkValidationError,
+    bulk_create_subscriptions,
+    bulk_delete_subscriptions,
+    bulk_update_subscriptions,
+)
 from .models import Subscription
 from .serializers import SubscriptionSerializer
 
 
 class SubscriptionViewSet(viewsets.ModelViewSet):
-    """API endpoint that allows users to view and manage their subscriptions"""
+    """API endpoint that allows users to view and manage their subscriptions.
+    Actions are async; reads go through Django's async ORM and only validation
+    and saving fall back to a worker thread
+    """
     serializer_class = SubscriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         """Returns a list of all the subscriptions for the currently authenticated user"""
-        return Subscription.objects.filter(user=self.request.user)
+        return Subscription.objects.filter(user_id=self.request.user.id)
 
-    def perform_create(self, serializer):
+    async def alist(self, request, *args, **kwargs):
+        """Materializes the queryset with the async ORM before serializing,
+        so rendering the response needs no further queries
+        """
+        subscriptions = [subscription async for subscription in self.get_queryset()]
+        serializer = self.get_serializer(subscriptions, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    async def perform_acreate(self, serializer):
         """Associates the subscription with the currently authenticated user"""
-        serializer.save(user=self.request.user)
\ No newline at end of file
+        await sync_to_async(serializer.save)(user_id=self.request.user.id)
+
+    async def perform_aupdate(self, serializer):
+        await sync_to_async(serializer.save)()
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    async def bulk(self, request):
+        """Creates (POST), updates (PATCH, items need an `id`) or deletes (DELETE, a list
+        of ids) up to SUBSCRIPTION_BULK_LIMIT subscriptions in one transaction.
+        If any item is invalid nothing is written and the errors are reported per item index
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of items.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.SUBSCRIPTION_BULK_LIMIT:
+            return Response(
+                {'detail': f'At most {settings.SUBSCRIPTION_BULK_LIMIT} items are allowed per request.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user_id = request.user.id
+        context = {**self.get_serializer_context(), 'bulk': True}
+        try:
+            if request.method == 'DELETE':
+                deleted = await sync_to_async(bulk_delete_subscriptions)(user_id, items)
+                return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+            if request.method == 'POST':
+                subscriptions = await sync_to_async(bulk_create_subscriptions)(user_id, items, context)
+                response_status = status.HTTP_201_CREATED
+            else:
+                subscriptions = await sync_to_async(bulk_update_subscriptions)(user_id, items, context)
+                response_status = status.HTTP_200_OK
+        except BulkValidationError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(subscriptions, many=True)
+        return Response(serializer.data, status=response_status)
@@ -0,0 +1,133 @@
+import json
+import re
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from traffic.middleware import REDACTED
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+def endpoint(record):
+    """Groups calls by route, e.g. 'PATCH /api/subscriptions/{id}/'"""
+    route = re.sub(r'/\d+/', '/{id}/', record['path'].split('?')[0])
+    return f"{record['method']} {route}"
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays API traffic recorded by API_TRAFFIC_LOG against a running server at one or more '
+        'rate multipliers, reporting throughput and latency percentiles per endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Recorded JSONL file (defaults to API_TRAFFIC_LOG)')
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument(
+            '--rate', type=float, nargs='+', default=[1.0],
+            help='Speed-up factors applied to the recorded timing, e.g. --rate 1 2 4',
+        )
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--email', help='Existing user to replay as (a throwaway user is registered otherwise)')
+        parser.add_argument('--password')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.API_TRAFFIC_LOG
+        if not path:
+            raise CommandError('Pass a recorded file or set API_TRAFFIC_LOG.')
+        try:
+            with open(path, encoding='utf-8') as log:
+                records = sorted((json.loads(line) for line in log if line.strip()), key=lambda r: r['ts'])
+        except OSError as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        if not records:
+            raise CommandError(f'{path} has no recorded requests.')
+
+        self.base_url = options['base_url'].rstrip('/')
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=options['concurrency'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.credentials = self._credentials(options)
+        self.tokens = self._tokens()
+        self.session.headers['Authorization'] = f'Bearer {self.tokens["access"]}'
+
+        recorded_span = records[-1]['ts'] - records[0]['ts']
+        self.stdout.write(f'Replaying {len(records)} requests recorded over {recorded_span:.1f}s')
+        for rate in options['rate']:
+            self._replay(records, rate, options['concurrency'])
+
+    def _credentials(self, options):
+        if options['email']:
+            return {'email': options['email'], 'password': options['password']}
+        credentials = {'email': f'replay-{uuid.uuid4().hex[:12]}@example.com', 'password': uuid.uuid4().hex}
+        response = self.session.post(f'{self.base_url}/api/users/register/', json=credentials)
+        if not response.ok:
+            raise CommandError(f'Could not register the replay user: {response.status_code} {response.text}')
+        return credentials
+
+    def _tokens(self):
+        response = self.session.post(f'{self.base_url}/api/users/token/', json=self.credentials)
+        if not response.ok:
+            raise CommandError(f'Could not obtain a token: {response.status_code} {response.text}')
+        return response.json()
+
+    def _body(self, record):
+        body = record.get('body')
+        if not isinstance(body, dict):
+            return body
+        if body.get('password') == REDACTED:
+            body = {**body, **self.credentials}
+        # Redacted tokens become the replay user's, e.g. for /api/users/token/refresh/.
+        return {key: self.tokens.get(key, value) if value == REDACTED else value for key, value in body.items()}
+
+    def _replay(self, records, rate, concurrency):
+        results = defaultdict(list)
+        lock = threading.Lock()
+        first = records[0]['ts']
+
+        def send(record):
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    record['method'], f"{self.base_url}{record['path']}", json=self._body(record), timeout=30,
+                )
+                status = response.status_code
+            except requests.RequestException:
+                status = None
+            latency = time.perf_counter() - started
+            with lock:
+                results[endpoint(record)].append((latency, status, record.get('status')))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for record in records:
+                # Keep the recorded spacing, compressed by the rate multiplier.
+                delay = (record['ts'] - first) / rate - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(send, record)
+        elapsed = time.perf_counter() - started
+
+        total = sum(len(calls) for calls in results.values())
+        self.stdout.write(f'\nx{rate:g}: {total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)')
+        for name, calls in sorted(results.items()):
+            latencies = [latency for latency, _, _ in calls]
+            errors = sum(1 for _, status, _ in calls if status is None or status >= 500)
+            changed = sum(1 for _, status, recorded in calls if status is not None and status != recorded)
+            self.stdout.write(
+                f'  {name:<36} n={len(calls):<6} '
+                f'p50 {statistics.median(latencies) * 1000:7.1f} ms  '
+                f'p95 {percentile(latencies, 95) * 1000:7.1f} ms  '
+                f'p99 {percentile(latencies, 99) * 1000:7.1f} ms  '
+                f'errors {errors}  status changed {changed}'
+            )
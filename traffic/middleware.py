@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import time
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+
+REDACTED = '<redacted>'
+# Body fields never written to the log: credentials and JWTs (token pairs are
+# posted back to /api/users/token/refresh/ and friends).
+SENSITIVE_FIELDS = frozenset({'password', 'refresh', 'access', 'token'})
+
+
+def _traffic_logger(path):
+    logger = logging.getLogger('api_traffic')
+    path = os.path.abspath(path)
+    if not any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+        handler = logging.FileHandler(path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+def _request_body(request):
+    try:
+        body = json.loads(request.body) if request.body else None
+    except ValueError:
+        return None
+    if isinstance(body, dict) and not SENSITIVE_FIELDS.isdisjoint(body):
+        # Replays fill these in with the replay user's own credentials and tokens.
+        body = {key: REDACTED if key in SENSITIVE_FIELDS else value for key, value in body.items()}
+    return body
+
+@sync_and_async_middleware
+def traffic_recorder(get_response):
+    """Appends one JSON line per API_TRAFFIC_PATHS request to API_TRAFFIC_LOG,
+    for `manage.py replay_api_traffic`. Passwords and tokens are redacted and
+    no headers are kept. Unused unless API_TRAFFIC_LOG is set
+    """
+    if not settings.API_TRAFFIC_LOG:
+        raise MiddlewareNotUsed
+    logger = _traffic_logger(settings.API_TRAFFIC_LOG)
+
+    def should_record(request):
+        return request.path.startswith(tuple(settings.API_TRAFFIC_PATHS))
+
+    def record(request, response, started, duration):
+        logger.info(json.dumps({
+            'ts': round(started, 6),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'body': _request_body(request),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+        }))
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not should_record(request):
+                return await get_response(request)
+            request.body  # Read before the view consumes the stream.
+            started, clock = time.time(), time.perf_counter()
+            response = await get_response(request)
+            record(request, response, started, time.perf_counter() - clock)
+            return response
+    else:
+        def middleware(request):
+            if not should_record(request):
+                return get_response(request)
+            request.body  # Read before the view consumes the stream.
+            started, clock = time.time(), time.perf_counter()
+            response = get_response(request)
+            record(request, response, started, time.perf_counter() - clock)
+            return response
+
+    return middleware
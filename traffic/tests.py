@@ -0,0 +1,76 @@
+import io
+import json
+import pytest
+from django.core.management import call_command
+from rest_framework.test import APIClient
+from users.models import User
+
+
+@pytest.fixture
+def api_client():
+    """A fixture that returns an unauthenticated API client"""
+    return APIClient()
+
+@pytest.fixture
+def test_user():
+    """A fixture that creates and returns a user for authentication"""
+    return User.objects.create_user(email='testuser@example.com', password='password123')
+
+@pytest.mark.django_db
+class TestApiTrafficReplay:
+    """Groups tests for recording API traffic and replaying it"""
+
+    def test_requests_are_recorded(self, settings, tmp_path, api_client, test_user):
+        """Tests API calls being logged as JSON lines with passwords redacted"""
+        settings.API_TRAFFIC_LOG = str(tmp_path / 'traffic.jsonl')
+
+        api_client.post('/api/users/token/', {'email': test_user.email, 'password': 'password123'}, format='json')
+        api_client.force_authenticate(user=test_user)
+        api_client.get('/api/subscriptions/')
+        api_client.get('/admin/login/')
+
+        records = [json.loads(line) for line in (tmp_path / 'traffic.jsonl').read_text().splitlines()]
+        assert [(record['method'], record['path'], record['status']) for record in records] == [
+            ('POST', '/api/users/token/', 200),
+            ('GET', '/api/subscriptions/', 200),
+        ]
+        assert records[0]['body'] == {'email': test_user.email, 'password': '<redacted>'}
+
+    def test_refresh_tokens_are_redacted(self, settings, tmp_path, api_client, test_user):
+        """Tests the refresh endpoint being logged without the refresh token"""
+        settings.API_TRAFFIC_LOG = str(tmp_path / 'traffic.jsonl')
+
+        tokens = api_client.post(
+            '/api/users/token/', {'email': test_user.email, 'password': 'password123'}, format='json'
+        ).json()
+        response = api_client.post('/api/users/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+
+        log = (tmp_path / 'traffic.jsonl').read_text()
+        records = [json.loads(line) for line in log.splitlines()]
+        assert response.status_code == 200
+        assert records[1]['path'] == '/api/users/token/refresh/'
+        assert records[1]['body'] == {'refresh': '<redacted>'}
+        assert tokens['refresh'] not in log
+
+    @pytest.mark.django_db(transaction=True)
+    def test_replay_reports_percentiles(self, live_server, tmp_path):
+        """Tests a recorded session being replayed against a running server"""
+        recorded = [
+            {'ts': 0.0, 'method': 'POST', 'path': '/api/users/token/', 'status': 200,
+             'body': {'email': 'someone@example.com', 'password': '<redacted>'}},
+            {'ts': 0.1, 'method': 'POST', 'path': '/api/subscriptions/', 'status': 201,
+             'body': {'city': 'Oslo', 'notification_period': 1, 'notification_method': 'email'}},
+            {'ts': 0.2, 'method': 'GET', 'path': '/api/subscriptions/', 'status': 200, 'body': None},
+            {'ts': 0.3, 'method': 'POST', 'path': '/api/users/token/refresh/', 'status': 200,
+             'body': {'refresh': '<redacted>'}},
+        ]
+        log = tmp_path / 'traffic.jsonl'
+        log.write_text('\n'.join(json.dumps(record) for record in recorded))
+        out = io.StringIO()
+
+        call_command('replay_api_traffic', str(log), '--base-url', live_server.url, '--rate', '1', '4', stdout=out)
+
+        report = out.getvalue()
+        assert 'x1: 4 requests' in report and 'x4: 4 requests' in report
+        assert 'POST /api/users/token/' in report
+        assert 'errors 0  status changed 0' in report.split('x4:')[0]
@@ -5,12 +5,12 @@ from .models import User
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
-    list_display = ('email', 'is_staff', 'is_active', 'date_joined')
+    list_display = ('email', 'is_staff', 'is_active', 'email_digest', 'date_joined')
     search_fields = ('email',)
     ordering = ('email',)
 
     fieldsets = (
-        (None, {'fields': ('email', 'password')}),
+        (None, {'fields': ('email', 'password', 'email_digest')}),
         ('Permissions', {'fields': ('is_staff', 'is_active', 'is_superuser', 'groups', 'user_permissions')}),
     )
 
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from .models import User
+
+
+def user_status_cache_key(user_id) -> str:
+    return f'users:is_active:{user_id}'
+
+def is_user_active(user_id) -> bool:
+    """Returns whether the user still exists and is active, caching the answer
+    for JWT_USER_STATUS_CACHE_SECONDS so polling clients don't hit the users table
+    """
+    return cache.get_or_set(
+        user_status_cache_key(user_id),
+        lambda: User.objects.filter(pk=user_id, is_active=True).exists(),
+        timeout=settings.JWT_USER_STATUS_CACHE_SECONDS,
+    )
+
+
+class ClaimsTokenUser(TokenUser):
+    """A TokenUser that also exposes the email claim added at login"""
+
+    @cached_property
+    def email(self) -> str:
+        return self.token.get('email', '')
+
+    @cached_property
+    def is_active(self) -> bool:
+        return self.token.get('is_active', True)
+
+
+class CachedStatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """Builds the request user from token claims instead of loading the users row.
+    Deactivated or deleted users are still rejected through a short-lived
+    cached status check
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not user.is_active or not is_user_active(user.id):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
+
+
+class ConfigurableJWTAuthentication(CachedStatelessJWTAuthentication):
+    """Authenticates from token claims when JWT_STATELESS_AUTH is on and from the
+    users row otherwise. Views bind their authentication classes at import, so
+    the toggle is read per request instead
+    """
+
+    def get_user(self, validated_token):
+        if settings.JWT_STATELESS_AUTH:
+            return super().get_user(validated_token)
+        return JWTAuthentication.get_user(self, validated_token)
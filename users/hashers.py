@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2 with cost parameters from PASSWORD_ARGON2_* settings.
+    Keeps the 'argon2' algorithm name, so existing hashes are upgraded in place
+    on login when the parameters change
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """Scrypt with cost parameters from PASSWORD_SCRYPT_* settings"""
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+
+class RegistrationPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """Deliberately cheap PBKDF2 used only while a new account waits for
+    `upgrade_registration_password_hash` to wrap it in scrypt.
+    The iteration count is fixed because wrapped hashes depend on it
+    """
+    algorithm = 'pbkdf2_sha256_registration'
+    iterations = 20_000
+
+
+class ScryptWrappedRegistrationPasswordHasher(TunedScryptPasswordHasher):
+    """scrypt(registration PBKDF2 hash), sharing one salt.
+    Lets a background task strengthen a registration hash without ever
+    seeing the plaintext password
+    """
+    algorithm = 'scrypt_wrapped_pbkdf2_registration'
+
+    def encode_registration_hash(self, registration_hash, salt, n=None, r=None, p=None):
+        return super().encode(registration_hash, salt, n, r, p)
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        registration_hash = RegistrationPBKDF2PasswordHasher().encode(password, salt).split('$', 3)[3]
+        return self.encode_registration_hash(registration_hash, salt, n, r, p)
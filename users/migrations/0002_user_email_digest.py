@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_digest',
+            field=models.BooleanField(default=False, help_text='Combine all due email subscriptions into a single message per run.'),
+        ),
+    ]
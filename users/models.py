@@ -1,15 +1,31 @@
-from django.db import models
+from django.contrib.auth.hashers import make_password
+from django.db import models, transaction
+from .hashers import RegistrationPBKDF2PasswordHasher
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 
 class CustomUserManager(BaseUserManager):
-    def create_user(self, email, password=None):
+    def create_user(self, email, password=None, defer_hashing=False, **extra_fields):
+        """Creates a user. With `defer_hashing`, the password is stored with the
+        cheap registration hasher and strengthened by a Celery task after commit
+        """
         if not email:
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
-        user = self.model(email=email)
-        user.set_password(password)
+        user = self.model(email=email, **extra_fields)
+        defer_hashing = defer_hashing and password is not None
+        if defer_hashing:
+            user.password = make_password(password, hasher=RegistrationPBKDF2PasswordHasher.algorithm)
+        else:
+            user.set_password(password)
         user.save(using=self._db)
+
+        if defer_hashing:
+            from .tasks import upgrade_registration_password_hash
+
+            transaction.on_commit(
+                lambda: upgrade_registration_password_hash.delay(user.pk), using=self._db
+            )
         return user
 
     def create_superuser(self, email, password=None):
@@ -27,6 +43,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    email_digest = models.BooleanField(
+        default=False,
+        help_text='Combine all due email subscriptions into a single message per run.'
+    )
     date_joined = models.DateTimeField(auto_now_add=True)
 
     objects = CustomUserManager()
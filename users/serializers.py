@@ -1,4 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import User
 
 
@@ -11,11 +13,23 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ('email', 'password')
+        fields = ('email', 'password', 'email_digest')
 
     def create(self, validated_data):
         user = User.objects.create_user(
             email=validated_data['email'],
-            password=validated_data['password']
+            password=validated_data['password'],
+            email_digest=validated_data.get('email_digest', False),
+            defer_hashing=settings.PASSWORD_HASH_OFFLOAD,
         )
-        return user
\ No newline at end of file
+        return user
+
+class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the claims needed to build a user without a database lookup"""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['email'] = user.email
+        token['is_active'] = user.is_active
+        return token
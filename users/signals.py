@@ -0,0 +1,12 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import user_status_cache_key
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def clear_cached_user_status(sender, instance, **kwargs):
+    """Makes deactivation take effect immediately in this process"""
+    cache.delete(user_status_cache_key(instance.pk))
@@ -0,0 +1,23 @@
+import logging
+from celery import shared_task
+from .hashers import RegistrationPBKDF2PasswordHasher, ScryptWrappedRegistrationPasswordHasher
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def upgrade_registration_password_hash(user_id: int):
+    """Wraps a cheap registration hash in scrypt, off the request path.
+    The user's preferred hasher takes over on their next login
+    """
+    encoded = User.objects.filter(pk=user_id).values_list('password', flat=True).first()
+    if not encoded or not encoded.startswith(f'{RegistrationPBKDF2PasswordHasher.algorithm}$'):
+        return 'Skipped: no registration hash to upgrade.'
+
+    _, _, salt, registration_hash = encoded.split('$', 3)
+    wrapped = ScryptWrappedRegistrationPasswordHasher().encode_registration_hash(registration_hash, salt)
+
+    # Only replace the hash we read, in case the password changed meanwhile.
+    updated = User.objects.filter(pk=user_id, password=encoded).update(password=wrapped)
+    logger.info(f'Upgraded registration password hash for user {user_id}: {bool(updated)}')
+    return f'Upgraded: {bool(updated)}'
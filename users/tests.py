@@ -1,7 +1,13 @@
 import pytest
+from unittest.mock import patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from subscriptions.models import Subscription
 from .models import User
+from .tasks import upgrade_registration_password_hash
 
 
 @pytest.fixture
@@ -78,4 +84,107 @@ class TestUserAPI:
 
         assert response.status_code == status.HTTP_200_OK
         assert 'access' in response.data
-        assert 'refresh' not in response.data
\ No newline at end of file
+        assert 'refresh' not in response.data
+
+    def test_user_registration_with_email_digest(self, api_client):
+        """Tests a new user opting into the email digest at registration"""
+        payload = {
+            'email': 'digest_user@example.com',
+            'password': 'testpassword123',
+            'email_digest': True
+        }
+        response = api_client.post('/api/users/register/', data=payload)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert User.objects.get(email=payload['email']).email_digest is True
+
+@pytest.mark.django_db
+class TestDeferredPasswordHashing:
+    """Tests for the registration hashing offload mode"""
+
+    def test_registration_stores_cheap_hash(self, api_client, settings, django_capture_on_commit_callbacks):
+        """Tests registration storing the cheap hash and enqueueing the upgrade once committed"""
+        settings.PASSWORD_HASH_OFFLOAD = True
+        payload = {'email': 'burst@example.com', 'password': 'testpassword123'}
+
+        with patch('users.tasks.upgrade_registration_password_hash.delay') as delay:
+            with django_capture_on_commit_callbacks(execute=True) as callbacks:
+                response = api_client.post('/api/users/register/', data=payload)
+                delay.assert_not_called()
+
+        user = User.objects.get(email=payload['email'])
+        assert response.status_code == status.HTTP_201_CREATED
+        assert user.password.startswith('pbkdf2_sha256_registration$')
+        assert user.check_password(payload['password'])
+        assert len(callbacks) == 1
+        delay.assert_called_once_with(user.pk)
+
+    def test_upgrade_task_wraps_hash(self):
+        """Tests the background task strengthening the hash without the plaintext"""
+        user = User.objects.create_user(email='wrap@example.com', password='s3cret-pass', defer_hashing=True)
+
+        upgrade_registration_password_hash(user.pk)
+
+        user.refresh_from_db()
+        assert user.password.startswith('scrypt_wrapped_pbkdf2_registration$')
+        assert user.check_password('s3cret-pass')
+        assert not user.check_password('wrong-pass')
+
+    def test_login_upgrades_wrapped_hash_to_preferred_hasher(self, api_client):
+        """Tests the preferred hasher replacing the wrapped hash on first login"""
+        user = User.objects.create_user(email='login@example.com', password='s3cret-pass', defer_hashing=True)
+        upgrade_registration_password_hash(user.pk)
+
+        response = api_client.post('/api/users/token/', data={'email': 'login@example.com', 'password': 's3cret-pass'})
+
+        user.refresh_from_db()
+        assert response.status_code == status.HTTP_200_OK
+        assert user.password.startswith('pbkdf2_sha256$')
+
+@pytest.fixture
+def stateless_auth(settings):
+    """A fixture that switches the API to claim-based JWT authentication"""
+    settings.JWT_STATELESS_AUTH = True
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('stateless_auth')
+class TestStatelessJWTAuthentication:
+    """Tests for authenticating from token claims without loading the user row"""
+
+    def _authenticate(self, api_client, email='claims@example.com', password='password123'):
+        user = User.objects.create_user(email=email, password=password)
+        token = api_client.post('/api/users/token/', data={'email': email, 'password': password}).data['access']
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return user
+
+    def test_token_contains_user_claims(self, api_client):
+        """Tests the access token carrying the email and is_active claims"""
+        user = self._authenticate(api_client)
+        token = AccessToken(api_client._credentials['HTTP_AUTHORIZATION'].split()[1])
+
+        assert token['email'] == user.email
+        assert token['is_active'] is True
+
+    def test_repeated_requests_skip_users_table(self, api_client):
+        """Tests polling the subscription list not touching the users table after the first request"""
+        user = self._authenticate(api_client)
+        Subscription.objects.create(user=user, city='Oslo', notification_period=1, notification_method='email')
+        api_client.get('/api/subscriptions/')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get('/api/subscriptions/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['user'] for item in response.data] == [user.email]
+        assert len(queries) == 1
+        assert not [query for query in queries if 'users_user' in query['sql']]
+
+    def test_deactivated_user_is_rejected(self, api_client):
+        """Tests deactivation revoking access despite a still-valid token"""
+        user = self._authenticate(api_client)
+        assert api_client.get('/api/subscriptions/').status_code == status.HTTP_200_OK
+
+        user.is_active = False
+        user.save()
+
+        assert api_client.get('/api/subscriptions/').status_code == status.HTTP_401_UNAUTHORIZED
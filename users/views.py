@@ -1,4 +1,6 @@
-from rest_framework import generics, status
+from adrf import generics
+from asgiref.sync import sync_to_async
+from rest_framework import status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from .serializers import UserRegistrationSerializer
@@ -8,13 +10,16 @@ class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny]
 
-    def create(self, request, *args, **kwargs):
+    async def acreate(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await self.perform_acreate(serializer)
         headers = self.get_success_headers(serializer.data)
         return Response(
             {'message': 'User created successfully.'},
             status=status.HTTP_201_CREATED,
             headers=headers
-        )
\ No newline at end of file
+        )
+
+    async def perform_acreate(self, serializer):
+        await sync_to_async(serializer.save)()